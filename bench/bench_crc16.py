@@ -0,0 +1,45 @@
+"""
+CRC16/Modbus per frame: table driven against the bitwise reference, and
+against PyCRC (the former pythoncrc requirement) when it is installed
+python bench/bench_crc16.py
+"""
+
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "config", "custom_components", "hysen2pfc"))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+from crc16 import crc16_modbus
+from test_crc16 import reference_crc16_modbus
+
+# status read request and a 16 words status response
+REQUEST = bytes.fromhex("01 03 00 00 00 10")
+RESPONSE = bytes.fromhex("01 03 20") + bytes(range(32))
+NUMBER = 50000
+
+
+def report(name, function, data):
+    elapsed = timeit.timeit(lambda: function(data), number=NUMBER)
+    print("%-14s %3d bytes: %8.2f us/frame" % (name, len(data), elapsed / NUMBER * 1e6))
+
+
+def main():
+    candidates = [
+        ("table", crc16_modbus),
+        ("bitwise", reference_crc16_modbus),
+    ]
+    try:
+        from PyCRC.CRC16 import CRC16
+        candidates.append(("PyCRC", lambda data: CRC16(modbus_flag=True).calculate(data)))
+    except ImportError:
+        pass
+    for data in (REQUEST, RESPONSE):
+        for name, function in candidates:
+            report(name, function, data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Packets per second of the kept CBC contexts against a new context per packet,
+for every AES backend that is installed
+python bench/bench_crypto.py
+"""
+
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "config", "custom_components", "hysen2pfc"))
+
+import broadlink_crypto
+from broadlink_crypto import broadlink_cipher
+
+KEY = bytes(range(16))
+IV = bytes(range(16, 32))
+# padded status read request and a status response
+PAYLOADS = (bytes(16), bytes(48))
+NUMBER = 20000
+
+
+def backends():
+    try:
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+        from cryptography.hazmat.backends import default_backend
+        yield "cryptography", {
+            "Cipher": Cipher, "algorithms": algorithms, "modes": modes,
+            "default_backend": default_backend}
+    except ImportError:
+        pass
+    try:
+        from Crypto.Cipher import AES
+        yield "pycryptodome", {"AES": AES}
+    except ImportError:
+        pass
+    try:
+        import pyaes
+        yield "pyaes", {"pyaes": pyaes}
+    except ImportError:
+        pass
+
+
+def main():
+    for name, modules in backends():
+        for attr, value in modules.items():
+            setattr(broadlink_crypto, attr, value)
+        broadlink_crypto.BROADLINK_AES_BACKEND = name
+        cipher = broadlink_cipher(KEY, IV)
+        for payload in PAYLOADS:
+            kept = timeit.timeit(lambda: cipher.encrypt(payload), number=NUMBER)
+            fresh = timeit.timeit(
+                lambda: broadlink_crypto._cbc_contexts(KEY, IV)[0](payload), number=NUMBER)
+            print("%-13s %2d bytes: kept %8.0f/s  fresh %8.0f/s"
+                  % (name, len(payload), NUMBER / kept, NUMBER / fresh))
+
+
+if __name__ == "__main__":
+    main()
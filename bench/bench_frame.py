@@ -0,0 +1,39 @@
+"""
+Frames per second of the header template against the original per-byte builder
+python bench/bench_frame.py
+"""
+
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "config", "custom_components", "hysen2pfc"))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+from broadlink_crypto import BROADLINK_AES_BACKEND, broadlink_cipher
+from broadlink_frame import broadlink_frame
+from test_broadlink_frame import ID, MAC, reference_packet, template_packet
+
+KEY = bytes(range(16))
+IV = bytes(range(16, 32))
+# status read, framed by send_request
+PAYLOAD = bytes([0x08, 0x00, 0x01, 0x03, 0x00, 0x00, 0x00, 0x10, 0xc5, 0xc6])
+NUMBER = 20000
+
+
+def main():
+    cipher = broadlink_cipher(KEY, IV)
+    frame = broadlink_frame(MAC)
+    frame.set_id(ID)
+    before = timeit.timeit(
+        lambda: reference_packet(MAC, ID, 0x6a, 0x1234, PAYLOAD, cipher.encrypt), number=NUMBER)
+    after = timeit.timeit(
+        lambda: template_packet(frame, 0x6a, 0x1234, PAYLOAD, cipher.encrypt), number=NUMBER)
+    print("AES backend: %s" % BROADLINK_AES_BACKEND)
+    print("per-byte builder: %8.0f frames/s" % (NUMBER / before))
+    print("header template:  %8.0f frames/s" % (NUMBER / after))
+
+
+if __name__ == "__main__":
+    main()
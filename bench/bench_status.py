@@ -0,0 +1,63 @@
+"""
+Status decode per poll: the written-out decoder against the decoder generated
+from the register map with eval (previous version) and a per-field loop
+python bench/bench_status.py
+"""
+
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+import conftest  # noqa: F401, registers the hysen2pfc package
+from hysen2pfc.hysen2pfc_device import (
+    HYSEN_2PFC_STATUS_MAP,
+    HYSEN_2PFC_STATUS_SCALE,
+    HYSEN_2PFC_STATUS_STRUCT,
+    Hysen2PipeFanCoilStatus,
+)
+
+DATA = bytes(range(32))
+NUMBER = 200000
+
+
+def eval_decoder():
+    terms = []
+    for name, index, shift, mask in HYSEN_2PFC_STATUS_MAP:
+        term = 'raw[%d]' % index
+        if shift:
+            term = '(%s >> %d)' % (term, shift)
+        if mask is not None:
+            term = '(%s & 0x%02X)' % (term, mask)
+        if name in HYSEN_2PFC_STATUS_SCALE:
+            term = '(%s / %r)' % (term, HYSEN_2PFC_STATUS_SCALE[name])
+        terms.append(term)
+    return eval('lambda raw: (%s,)' % ', '.join(terms))
+
+
+FIELDS = tuple(
+    (index, shift, -1 if mask is None else mask, HYSEN_2PFC_STATUS_SCALE.get(name))
+    for name, index, shift, mask in HYSEN_2PFC_STATUS_MAP)
+
+
+def loop_decoder(raw):
+    return tuple(
+        (raw[index] >> shift) & mask if scale is None else raw[index] / scale
+        for index, shift, mask, scale in FIELDS)
+
+
+def main():
+    decoders = [("eval", eval_decoder()), ("per-field loop", loop_decoder)]
+    results = [("written out", lambda: Hysen2PipeFanCoilStatus.from_registers(DATA))]
+    for name, decode in decoders:
+        results.append((name, lambda decode=decode: tuple.__new__(
+            Hysen2PipeFanCoilStatus, decode(HYSEN_2PFC_STATUS_STRUCT.unpack_from(DATA, 0)))))
+    for name, function in results:
+        elapsed = timeit.timeit(function, number=NUMBER)
+        print("%-14s %5.2f us/status" % (name, elapsed / NUMBER * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,3 +3,22 @@ Support for Hysen Controller for 2 Pipe Fan Coil units.
 Hysen HY03AC-1-Wifi device and derivative
 http://www.xmhysen.com/products_detail/productId=201.html
 """
+from homeassistant.components.climate import DOMAIN as CLIMATE_DOMAIN
+
+
+async def async_setup(hass, config):
+    """Set up the integration, controllers are configured through config entries."""
+    return True
+
+
+async def async_setup_entry(hass, entry):
+    """Set up one controller from a config entry."""
+    hass.async_create_task(
+        hass.config_entries.async_forward_entry_setup(entry, CLIMATE_DOMAIN)
+    )
+    return True
+
+
+async def async_unload_entry(hass, entry):
+    """Unload one controller, the rest of the fleet keeps running."""
+    return await hass.config_entries.async_forward_entry_unload(entry, CLIMATE_DOMAIN)
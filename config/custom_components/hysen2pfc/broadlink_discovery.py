@@ -0,0 +1,129 @@
+"""
+Broadlink device discovery
+One hello is broadcast, every device on the segment answers with its type and
+MAC; the answers are collected for a fixed window
+"""
+
+import asyncio
+import collections
+import datetime
+import socket
+import struct
+import time
+
+from .broadlink_frame import broadlink_checksum
+
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+BROADLINK_DISCOVERY_PORT = 80
+BROADLINK_DISCOVERY_TIMEOUT = 3.0
+BROADLINK_HELLO_LEN = 0x30
+BROADLINK_HELLO_COMMAND = 0x06
+BROADLINK_HELLO_REPLY_LEN = 0x80
+
+broadlink_discovered = collections.namedtuple(
+    'broadlink_discovered', ('host', 'mac', 'devtype', 'name'))
+
+
+# Address of the interface routing to the LAN, no packet is sent
+def broadlink_local_ip():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect(('8.8.8.8', 53))
+        return s.getsockname()[0]
+
+
+# Hello carrying local time and the address the devices should answer to
+def broadlink_hello_packet(local_ip, port, now=None):
+    now = now or datetime.datetime.now()
+    packet = bytearray(BROADLINK_HELLO_LEN)
+    struct.pack_into('<i', packet, 0x08, int(-time.timezone / 3600))
+    struct.pack_into('<H', packet, 0x0c, now.year)
+    packet[0x0e] = now.minute
+    packet[0x0f] = now.hour
+    packet[0x10] = now.year % 100
+    packet[0x11] = now.isoweekday()
+    packet[0x12] = now.day
+    packet[0x13] = now.month
+    packet[0x18:0x1c] = socket.inet_aton(local_ip)[::-1]
+    struct.pack_into('<H', packet, 0x1c, port)
+    packet[0x26] = BROADLINK_HELLO_COMMAND
+    struct.pack_into('<H', packet, 0x20, broadlink_checksum(packet))
+    return packet
+
+
+# MAC is reported reversed, it is returned in the order used in the configuration
+def broadlink_hello_reply(data, addr):
+    devtype = data[0x34] | (data[0x35] << 8)
+    mac = bytes(data[0x3a:0x40][::-1])
+    name = bytes(data[0x40:]).split(b'\x00')[0].decode('utf-8', 'replace')
+    return broadlink_discovered((addr[0], BROADLINK_DISCOVERY_PORT), mac, devtype, name)
+
+
+class broadlink_discovery(asyncio.DatagramProtocol):
+    """Collects hello replies, one per device."""
+
+    def __init__(self, devtypes=None):
+        self.devtypes = devtypes
+        self.devices = collections.OrderedDict()
+
+    def datagram_received(self, data, addr):
+        if len(data) < 0x40 or data[0x26] != BROADLINK_HELLO_COMMAND:
+            return
+        device = broadlink_hello_reply(data, addr)
+        if self.devtypes is not None and device.devtype not in self.devtypes:
+            return
+        self.devices.setdefault((device.host, device.mac), device)
+
+    def error_received(self, exc):
+        _LOGGER.debug("Discovery endpoint error: %s", exc)
+
+
+# Broadcast one hello and return the devices answering within timeout seconds
+# devtypes restricts the result to the given device types
+async def broadlink_discover(timeout=BROADLINK_DISCOVERY_TIMEOUT, devtypes=None,
+                             local_ip_address=None,
+                             discover_ip_address='255.255.255.255',
+                             discover_port=BROADLINK_DISCOVERY_PORT):
+    loop = asyncio.get_running_loop()
+    if local_ip_address is None:
+        local_ip_address = await loop.run_in_executor(None, broadlink_local_ip)
+    transport, discovery = await loop.create_datagram_endpoint(
+        lambda: broadlink_discovery(devtypes),
+        local_addr=(local_ip_address, 0),
+        allow_broadcast=True)
+    try:
+        port = transport.get_extra_info('sockname')[1]
+        transport.sendto(
+            broadlink_hello_packet(local_ip_address, port),
+            (discover_ip_address, discover_port))
+        await asyncio.sleep(timeout)
+    finally:
+        transport.close()
+    return list(discovery.devices.values())
+
+
+class broadlink_responder(asyncio.DatagramProtocol):
+    """Answers hellos like a device would, for testing discovery without hardware."""
+
+    def __init__(self, mac, devtype, name=''):
+        self.mac = bytes(mac)
+        self.devtype = devtype
+        self.name = name
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < BROADLINK_HELLO_LEN or data[0x26] != BROADLINK_HELLO_COMMAND:
+            return
+        reply = bytearray(BROADLINK_HELLO_REPLY_LEN)
+        reply[0x26] = BROADLINK_HELLO_COMMAND
+        struct.pack_into('<H', reply, 0x34, self.devtype)
+        reply[0x3a:0x40] = self.mac[::-1]
+        name = self.name.encode()[:0x3e]
+        reply[0x40:0x40 + len(name)] = name
+        struct.pack_into('<H', reply, 0x20, broadlink_checksum(reply))
+        self.transport.sendto(reply, addr)
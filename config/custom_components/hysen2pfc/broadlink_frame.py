@@ -0,0 +1,62 @@
+"""
+Broadlink packet framing
+The 0x38 bytes header is built once per device, each packet only patches
+command, count and checksums
+"""
+
+import struct
+
+BROADLINK_HEADER_LEN = 0x38
+BROADLINK_CHECKSUM_SEED = 0xbeaf
+
+_UINT16 = struct.Struct('<H')
+
+
+def broadlink_checksum(data, seed=BROADLINK_CHECKSUM_SEED):
+    return (seed + sum(memoryview(data))) & 0xffff
+
+
+# pad the payload for AES encryption
+# a whole block is added when the payload is already aligned, as the devices expect
+def broadlink_pad(payload):
+    if not payload:
+        return payload
+    return bytes(payload).ljust((len(payload) // 16 + 1) * 16, b"\x00")
+
+
+class broadlink_frame:
+    """Header template of one device."""
+
+    def __init__(self, mac):
+        self.header = bytearray(BROADLINK_HEADER_LEN)
+        self.header[0x00:0x08] = b'\x5a\xa5\xaa\x55\x5a\xa5\xaa\x55'
+        self.header[0x24] = 0x2a
+        self.header[0x25] = 0x27
+        self.header[0x2a:0x30] = bytes(mac[0:6])
+        self.set_id(bytes(4))
+
+    def set_id(self, id):
+        self.header[0x30:0x34] = bytes(id[0:4])
+        # sum of the bytes that do not change from packet to packet
+        self.header_sum = sum(self.header)
+
+    # header checksum covers the whole packet, payload checksum the plain padded payload
+    def build(self, command, count, payload_checksum, encrypted):
+        packet = bytearray(BROADLINK_HEADER_LEN + len(encrypted))
+        packet[0:BROADLINK_HEADER_LEN] = self.header
+        packet[BROADLINK_HEADER_LEN:] = encrypted
+        packet[0x26] = command
+        _UINT16.pack_into(packet, 0x28, count)
+        _UINT16.pack_into(packet, 0x34, payload_checksum)
+        checksum = (BROADLINK_CHECKSUM_SEED
+                    + self.header_sum
+                    + command
+                    + (count & 0xff) + (count >> 8)
+                    + (payload_checksum & 0xff) + (payload_checksum >> 8)
+                    + sum(memoryview(encrypted))) & 0xffff
+        _UINT16.pack_into(packet, 0x20, checksum)
+        return packet
+
+
+def broadlink_reply_count(data):
+    return _UINT16.unpack_from(data, 0x28)[0]
@@ -4,10 +4,12 @@ Hysen HY03AC-1-Wifi device and derivative
 http://www.xmhysen.com/products_detail/productId=201.html
 """
 import asyncio
+from datetime import timedelta
 from functools import partial
 import binascii
 import socket
 import logging
+import math
 
 import voluptuous as vol
 
@@ -52,12 +54,33 @@ from homeassistant.const import (
     ATTR_TEMPERATURE,
     PRECISION_WHOLE,
     ATTR_ENTITY_ID,
+    EVENT_HOMEASSISTANT_STOP,
 )
+from homeassistant.config_entries import SOURCE_IMPORT
+from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
 import homeassistant.util.dt as dt_util
 
+from .const import (
+    DOMAIN as HYSEN_2PFC_DOMAIN,
+    HYSEN_2PFC_DEFAULT_NAME,
+    HYSEN_2PFC_DEFAULT_TIMEOUT,
+    CONF_SHARED_SOCKET,
+    CONF_HEDGE_READS,
+    CONF_ROOM_TEMP_DEADBAND,
+    HYSEN_2PFC_DEFAULT_ROOM_TEMP_DEADBAND,
+    CONF_POLL_MIN_INTERVAL,
+    CONF_POLL_MAX_INTERVAL,
+    HYSEN_2PFC_DEFAULT_POLL_MIN_INTERVAL,
+    HYSEN_2PFC_DEFAULT_POLL_MAX_INTERVAL,
+    HYSEN_2PFC_MIN_POLL_INTERVAL,
+)
 from .hysen2pfc_device import (
     Hysen2PipeFanCoilDevice,
+    HYSEN_2PFC_DEV_TYPE,
+    HYSEN_2PFC_CLOCK_MAX_ERROR,
     HYSEN_2PFC_REMOTE_LOCK_OFF,
     HYSEN_2PFC_REMOTE_LOCK_ON,
     HYSEN_2PFC_KEY_ALL_UNLOCKED,
@@ -94,6 +117,7 @@ from .hysen2pfc_device import (
     HYSEN_2PFC_HEATING_MIN_TEMP,
     HYSEN_2PFC_MAX_TEMP,
     HYSEN_2PFC_MIN_TEMP,
+    broadlink_protocol,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -235,19 +259,82 @@ HASS_PERIOD_ENABLED_TO_HYSEN = {
     False: HYSEN_2PFC_PERIOD_DISABLED,
 }
 
-HYSEN_2PFC_DEV_TYPE = 0x4F5B
-HYSEN_2PFC_DEFAULT_NAME = "Hysen 2 Pipe Fan Coil Thermostat"
-HYSEN_2PFC_DEFAULT_TIMEOUT = 10
+# Status fields announced by EVENT_TRANSITION, with the values reported for them
+TRANSITION_FIELDS = {
+    "valve_state": HYSEN_VALVE_STATE_TO_HASS,
+    "power_state": HYSEN_POWER_STATE_TO_HASS,
+    "operation_mode": HYSEN_MODE_TO_HASS,
+}
+# The clock and the room temperature within its deadband alone do not make a new state
+STATE_IGNORED_FIELDS = dict.fromkeys(
+    ("room_temp", "clock_hour", "clock_min", "clock_sec", "clock_weekday")
+)
 
 DATA_KEY = "climate.hysen_2pfc"
-
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
-    {
-        vol.Optional(CONF_NAME, default=HYSEN_2PFC_DEFAULT_NAME): cv.string,
-        vol.Required(CONF_HOST): cv.string,
-        vol.Required(CONF_MAC): cv.string,
-        vol.Optional(CONF_TIMEOUT, default=HYSEN_2PFC_DEFAULT_TIMEOUT): cv.positive_int,
-    }
+DATA_KEY_PROTOCOL = "climate.hysen_2pfc_protocol"
+DATA_KEY_SESSIONS = "climate.hysen_2pfc_sessions"
+DATA_KEY_STARTUP = "climate.hysen_2pfc_startup"
+DATA_KEY_COORDINATOR = "climate.hysen_2pfc_coordinator"
+DATA_KEY_ENTITIES = "climate.hysen_2pfc_entities"
+
+# Controllers due for a poll are read on every tick, at most POLL_CONCURRENCY at a time,
+# each in a task of its own so a controller not answering does not hold up the others
+POLL_TICK = timedelta(seconds=5)
+POLL_CONCURRENCY = 64
+# Seconds after a programmed switch a controller is read to show its new state
+TRANSITION_POLL_DELAY = 2
+
+# Devices a service call addresses at the same time unless the call says otherwise
+SERVICE_CONCURRENCY = 32
+
+EVENT_SERVICE_RESULT = "hysen2pfc_service_result"
+# Fired when the valve, the power or the mode of a controller changed
+EVENT_TRANSITION = "hysen2pfc_transition"
+
+# Controllers brought up at the same time after their entities were added
+STARTUP_CONCURRENCY = 8
+
+SESSION_STORAGE_KEY = "hysen2pfc.sessions"
+SESSION_STORAGE_VERSION = 1
+SESSION_SAVE_DELAY = 10
+
+
+def _valid_poll_intervals(config):
+    """Reject a shortest poll interval longer than the longest one."""
+    poll_min = config.get(CONF_POLL_MIN_INTERVAL, HYSEN_2PFC_DEFAULT_POLL_MIN_INTERVAL)
+    poll_max = config.get(CONF_POLL_MAX_INTERVAL, HYSEN_2PFC_DEFAULT_POLL_MAX_INTERVAL)
+    if poll_min > poll_max:
+        raise vol.Invalid(
+            "%s (%d) is longer than %s (%d)"
+            % (CONF_POLL_MIN_INTERVAL, poll_min, CONF_POLL_MAX_INTERVAL, poll_max)
+        )
+    return config
+
+
+PLATFORM_SCHEMA = vol.All(
+    PLATFORM_SCHEMA.extend(
+        {
+            vol.Optional(CONF_NAME, default=HYSEN_2PFC_DEFAULT_NAME): cv.string,
+            vol.Required(CONF_HOST): cv.string,
+            vol.Required(CONF_MAC): cv.string,
+            vol.Optional(
+                CONF_TIMEOUT, default=HYSEN_2PFC_DEFAULT_TIMEOUT
+            ): cv.positive_int,
+            vol.Optional(CONF_SHARED_SOCKET, default=True): cv.boolean,
+            vol.Optional(CONF_HEDGE_READS, default=False): cv.boolean,
+            vol.Optional(
+                CONF_ROOM_TEMP_DEADBAND, default=HYSEN_2PFC_DEFAULT_ROOM_TEMP_DEADBAND
+            ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+            # no defaults, a scan_interval is imported as the shortest poll interval
+            vol.Optional(CONF_POLL_MIN_INTERVAL): vol.All(
+                vol.Coerce(int), vol.Range(min=HYSEN_2PFC_MIN_POLL_INTERVAL)
+            ),
+            vol.Optional(CONF_POLL_MAX_INTERVAL): vol.All(
+                vol.Coerce(int), vol.Range(min=HYSEN_2PFC_MIN_POLL_INTERVAL)
+            ),
+        }
+    ),
+    _valid_poll_intervals,
 )
 
 ATTR_KEY_LOCK = "key_lock"
@@ -283,6 +370,21 @@ ATTR_PERIOD2_OFF_ENABLED = "period2_off_enabled"
 ATTR_PERIOD2_OFF_HOUR = "period2_off_hour"
 ATTR_PERIOD2_OFF_MIN = "period2_off_min"
 ATTR_TIME_VALVE_ON = "time_valve_on"
+ATTR_ROUND_TRIP_TIME = "round_trip_time"
+ATTR_RETRANSMISSION_TIMEOUT = "retransmission_timeout"
+ATTR_HEDGES_SENT = "hedges_sent"
+ATTR_HEDGES_WON = "hedges_won"
+ATTR_AUTH_HANDSHAKES = "auth_handshakes"
+ATTR_AUTH_HANDSHAKES_AVOIDED = "auth_handshakes_avoided"
+ATTR_STARTUP_TIME = "startup_time"
+ATTR_POLL_INTERVAL = "poll_interval"
+ATTR_CONCURRENCY = "concurrency"
+ATTR_SERVICE = "service"
+ATTR_SUCCEEDED = "succeeded"
+ATTR_FAILED = "failed"
+ATTR_ATTRIBUTE = "attribute"
+ATTR_OLD_STATE = "old_state"
+ATTR_NEW_STATE = "new_state"
 
 SERVICE_SET_KEY_LOCK = "hysen2pfc_set_key_lock"
 SERVICE_SET_HYSTERESIS = "hysen2pfc_set_hysteresis"
@@ -303,6 +405,7 @@ SERVICE_SET_PERIOD2_OFF = "hysen2pfc_set_period2_off"
 CLIMATE_SERVICE_SCHEMA = vol.Schema(
     {
         vol.Optional(ATTR_ENTITY_ID): cv.entity_ids,
+        vol.Optional(ATTR_CONCURRENCY): vol.All(vol.Coerce(int), vol.Range(min=1)),
     }
 )
 
@@ -464,50 +567,310 @@ SERVICE_TO_METHOD = {
 }
 
 
+class Hysen2PipeFanCoilSessions:
+    """Session keys negotiated with the controllers, kept across restarts."""
+
+    def __init__(self, hass):
+        self._hass = hass
+        self._store = Store(hass, SESSION_STORAGE_VERSION, SESSION_STORAGE_KEY)
+        self._sessions = {}
+        self._devices = {}
+        self._load_task = None
+
+    async def async_load(self):
+        """Load the stored sessions once, however many platform entries ask."""
+        if self._load_task is None:
+            self._load_task = self._hass.async_create_task(self._async_load())
+        await self._load_task
+
+    async def _async_load(self):
+        self._sessions = await self._store.async_load() or {}
+        # packet counters move on after the handshake, save them on shutdown
+        self._hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_STOP, self._async_save_on_stop
+        )
+
+    def restore(self, hysen_device):
+        """Reuse the stored session of a device, returns True if there was one."""
+        mac = hysen_device.mac.hex()
+        self._devices[mac] = hysen_device
+        session = self._sessions.get(mac)
+        if session is None:
+            return False
+        try:
+            hysen_device.set_session(session)
+        except (KeyError, TypeError, ValueError) as exc:
+            _LOGGER.debug("[%s] Stored session discarded: %s", mac, exc)
+            return False
+        return True
+
+    @callback
+    def async_remember(self, hysen_device):
+        """Store the session just negotiated by a device."""
+        self._sessions[hysen_device.mac.hex()] = hysen_device.get_session()
+        self._store.async_delay_save(lambda: self._sessions, SESSION_SAVE_DELAY)
+
+    @callback
+    def async_forget(self, hysen_device):
+        """Save the session of a device being unloaded and let go of it."""
+        mac = hysen_device.mac.hex()
+        if self._devices.pop(mac, None) is not None and mac in self._sessions:
+            self.async_remember(hysen_device)
+
+    async def _async_save_on_stop(self, event):
+        for mac, hysen_device in self._devices.items():
+            if mac in self._sessions:
+                self._sessions[mac] = hysen_device.get_session()
+        await self._store.async_save(self._sessions)
+
+
+async def async_get_sessions(hass):
+    """Return the loaded session store shared by all platform entries."""
+    if DATA_KEY_SESSIONS not in hass.data:
+        hass.data[DATA_KEY_SESSIONS] = Hysen2PipeFanCoilSessions(hass)
+    await hass.data[DATA_KEY_SESSIONS].async_load()
+    return hass.data[DATA_KEY_SESSIONS]
+
+
+class Hysen2PipeFanCoilCoordinator:
+    """Polls every controller of the integration from a single timer."""
+
+    def __init__(self, hass):
+        self._hass = hass
+        self._unsub = None
+        # poll task of every controller being read, by unique_id
+        self._polls = {}
+        # controllers to read again as soon as the read they are in is done
+        self._queued = set()
+        self._semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+        self._utcoffset = dt_util.now().utcoffset()
+        # extra reads asked for, by unique_id and whole second of loop time
+        self._wakeups = {}
+
+    @callback
+    def async_start(self):
+        """Start the polling timer if it is not running yet."""
+        if self._unsub is None:
+            self._unsub = async_track_time_interval(
+                self._hass, self._async_poll, POLL_TICK
+            )
+
+    @callback
+    def async_stop(self):
+        """Stop the polling timer."""
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+        for handle in self._wakeups.values():
+            handle.cancel()
+        self._wakeups = {}
+        for task in self._polls.values():
+            task.cancel()
+        self._polls = {}
+        self._queued = set()
+
+    @callback
+    def async_poll_at(self, device, when):
+        """Read device at loop time when, between two ticks."""
+        key = (device.unique_id, math.ceil(when))
+        if key not in self._wakeups:
+            self._wakeups[key] = self._hass.loop.call_at(
+                key[1], self._async_wakeup, key, device
+            )
+
+    @callback
+    def _async_wakeup(self, key, device):
+        del self._wakeups[key]
+        if self._hass.data.get(DATA_KEY, {}).get(device.unique_id) is device:
+            self._async_poll_now(device)
+
+    @callback
+    def _async_poll_now(self, device):
+        """Read device now, or right after the read it is in so nothing is missed."""
+        if device.unique_id in self._polls:
+            self._queued.add(device.unique_id)
+            return
+        self._polls[device.unique_id] = self._hass.async_create_task(
+            self._async_poll_device(device)
+        )
+
+    async def _async_poll(self, now=None):
+        """Start a read of every controller due that is not being read already."""
+        _start = self._hass.loop.time()
+        all_devices = list(self._hass.data.get(DATA_KEY, {}).values())
+        # a DST change moves every clock by the same amount, all are set at once
+        _utcoffset = dt_util.now().utcoffset()
+        if _utcoffset != self._utcoffset:
+            self._utcoffset = _utcoffset
+            _LOGGER.debug("UTC offset changed to %s, setting all clocks", _utcoffset)
+            for device in all_devices:
+                self._hass.async_create_task(self._async_set_time_now(device))
+        devices = [
+            device
+            for device in all_devices
+            if device.unique_id not in self._polls and device.poll_due(_start)
+        ]
+        for device in devices:
+            self._async_poll_now(device)
+        if devices:
+            _LOGGER.debug(
+                "Polling %d devices, %d in flight", len(devices), len(self._polls)
+            )
+
+    async def _async_poll_device(self, device):
+        """Read one controller and write its state if it changed."""
+        _start = self._hass.loop.time()
+        try:
+            async with self._semaphore:
+                result = await device.async_poll()
+        except Exception as exc:
+            _LOGGER.error("[%s] Error in poll: %s", device.name, exc)
+            return
+        finally:
+            if self._polls.get(device.unique_id) is asyncio.current_task():
+                del self._polls[device.unique_id]
+                if device.unique_id in self._queued:
+                    self._queued.discard(device.unique_id)
+                    if self._hass.data.get(DATA_KEY, {}).get(device.unique_id) is device:
+                        self._async_poll_now(device)
+        if result and self._hass.data.get(DATA_KEY, {}).get(device.unique_id) is device:
+            device.async_write_ha_state()
+        _LOGGER.debug(
+            "[%s] Polled in %.3f s", device.name, self._hass.loop.time() - _start
+        )
+
+    async def _async_set_time_now(self, device):
+        async with self._semaphore:
+            if device.available:
+                await device.async_set_time_now()
+
+
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
-    """Set up the Hysen HVACR thermostat platform."""
+    """Import a controller configured in configuration.yaml as a config entry."""
+    hass.async_create_task(
+        hass.config_entries.flow.async_init(
+            HYSEN_2PFC_DOMAIN, context={"source": SOURCE_IMPORT}, data=dict(config)
+        )
+    )
+
+
+async def async_setup_entry(hass, config_entry, async_add_entities):
+    """Set up the Hysen HVACR thermostat of a config entry."""
     if DATA_KEY not in hass.data:
         hass.data[DATA_KEY] = {}
 
-    host = config.get(CONF_HOST)
-    name = config.get(CONF_NAME)
-    mac_addr = binascii.unhexlify(config.get(CONF_MAC).encode().replace(b":", b""))
-    timeout = config.get(CONF_TIMEOUT)
+    config = config_entry.data
+    host = config[CONF_HOST]
+    name = config[CONF_NAME]
+    mac_addr = binascii.unhexlify(config[CONF_MAC].encode().replace(b":", b""))
+    timeout = config.get(CONF_TIMEOUT, HYSEN_2PFC_DEFAULT_TIMEOUT)
+
+    # All controllers talk through one UDP socket unless a private one is asked for
+    protocol = None
+    if config.get(CONF_SHARED_SOCKET, True):
+        if DATA_KEY_PROTOCOL not in hass.data:
+            hass.data[DATA_KEY_PROTOCOL] = broadlink_protocol()
+        protocol = hass.data[DATA_KEY_PROTOCOL]
 
     hysen_device = Hysen2PipeFanCoilDevice(
-        (host, 80), mac_addr, HYSEN_2PFC_DEV_TYPE, timeout
+        (host, 80),
+        mac_addr,
+        HYSEN_2PFC_DEV_TYPE,
+        timeout,
+        protocol,
+        config.get(CONF_HEDGE_READS, False),
+    )
+    poll_min = config.get(CONF_POLL_MIN_INTERVAL, HYSEN_2PFC_DEFAULT_POLL_MIN_INTERVAL)
+    poll_max = config.get(CONF_POLL_MAX_INTERVAL, HYSEN_2PFC_DEFAULT_POLL_MAX_INTERVAL)
+
+    sessions = await async_get_sessions(hass)
+
+    device = Hysen2PipeFanCoil(
+        name,
+        hysen_device,
+        host,
+        sessions,
+        config.get(CONF_ROOM_TEMP_DEADBAND, HYSEN_2PFC_DEFAULT_ROOM_TEMP_DEADBAND),
+        poll_min,
+        poll_max,
     )
+    hass.data[DATA_KEY][device.unique_id] = device
+
+    if DATA_KEY_ENTITIES not in hass.data:
+        hass.data[DATA_KEY_ENTITIES] = {}
+    if DATA_KEY_STARTUP not in hass.data:
+        hass.data[DATA_KEY_STARTUP] = asyncio.Semaphore(STARTUP_CONCURRENCY)
+    if DATA_KEY_COORDINATOR not in hass.data:
+        hass.data[DATA_KEY_COORDINATOR] = Hysen2PipeFanCoilCoordinator(hass)
+    hass.data[DATA_KEY_COORDINATOR].async_start()
+
+    _async_register_services(hass)
+
+    # added unavailable right away, the device is brought up in the background
+    async_add_entities([device])
 
-    device = Hysen2PipeFanCoil(name, hysen_device, host)
-    hass.data[DATA_KEY][host] = device
 
-    async_add_entities([device], update_before_add=True)
+@callback
+def _async_register_services(hass):
+    """Register the thermostat services, once for all controllers."""
+    if hass.services.has_service(DOMAIN, SERVICE_SET_KEY_LOCK):
+        return
 
     async def async_service_handler(service):
-        """Map services to methods on target thermostat."""
+        """Map services to methods on target thermostats, called concurrently."""
         method = SERVICE_TO_METHOD.get(service.service)
         params = {
-            key: value for key, value in service.data.items() if key != ATTR_ENTITY_ID
+            key: value
+            for key, value in service.data.items()
+            if key not in (ATTR_ENTITY_ID, ATTR_CONCURRENCY)
         }
+        entities = hass.data[DATA_KEY_ENTITIES]
         entity_ids = service.data.get(ATTR_ENTITY_ID)
         if entity_ids:
             target_hvacrs = [
-                dev
-                for dev in hass.data[DATA_KEY].values()
-                if dev.entity_id in entity_ids
+                entities[entity_id] for entity_id in entity_ids if entity_id in entities
             ]
         else:
-            target_hvacrs = hass.data[DATA_KEY].values()
-
-        update_tasks = []
-        for hvacr in target_hvacrs:
-            await getattr(hvacr, method["method"])(**params)
-
-        for hvacr in target_hvacrs:
-            update_tasks.append(hvacr.async_update_ha_state(True))
+            target_hvacrs = list(entities.values())
+        semaphore = asyncio.Semaphore(
+            service.data.get(ATTR_CONCURRENCY, SERVICE_CONCURRENCY)
+        )
 
-        if update_tasks:
-            await asyncio.wait(update_tasks, loop=hass.loop)
+        async def async_call(hvacr):
+            async with semaphore:
+                # the state written by the method comes from the write echo, the
+                # next poll confirms it
+                try:
+                    result = await getattr(hvacr, method["method"])(**params)
+                except Exception as exc:
+                    _LOGGER.error(
+                        "[%s] Error in %s: %s", hvacr.entity_id, service.service, exc
+                    )
+                    result = False
+                return result
+
+        results = await asyncio.gather(*[async_call(hvacr) for hvacr in target_hvacrs])
+
+        succeeded = [
+            hvacr.entity_id for hvacr, result in zip(target_hvacrs, results) if result
+        ]
+        failed = [
+            hvacr.entity_id
+            for hvacr, result in zip(target_hvacrs, results)
+            if not result
+        ]
+        if failed:
+            _LOGGER.warning(
+                "%s failed on %d of %d devices: %s",
+                service.service,
+                len(failed),
+                len(target_hvacrs),
+                ", ".join(failed),
+            )
+        hass.bus.async_fire(
+            EVENT_SERVICE_RESULT,
+            {ATTR_SERVICE: service.service, ATTR_SUCCEEDED: succeeded, ATTR_FAILED: failed},
+        )
 
     for hvacr_service in SERVICE_TO_METHOD:
         schema = SERVICE_TO_METHOD[hvacr_service].get("schema", CLIMATE_SERVICE_SCHEMA)
@@ -516,22 +879,83 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
         )
 
 
+@callback
+def _async_release_shared(hass):
+    """Drop the services and the shared socket once the last controller is gone."""
+    for hvacr_service in SERVICE_TO_METHOD:
+        hass.services.async_remove(DOMAIN, hvacr_service)
+    hass.data.pop(DATA_KEY_ENTITIES, None)
+    hass.data.pop(DATA_KEY_STARTUP, None)
+    coordinator = hass.data.pop(DATA_KEY_COORDINATOR, None)
+    if coordinator is not None:
+        coordinator.async_stop()
+    protocol = hass.data.pop(DATA_KEY_PROTOCOL, None)
+    if protocol is not None:
+        protocol.close()
+
+
 class Hysen2PipeFanCoil(ClimateDevice):
     """Representation of a Hysen HVACR device."""
 
-    def __init__(self, name, hysen_device, host):
+    def __init__(
+        self,
+        name,
+        hysen_device,
+        host,
+        sessions,
+        room_temp_deadband=HYSEN_2PFC_DEFAULT_ROOM_TEMP_DEADBAND,
+        poll_min=HYSEN_2PFC_DEFAULT_POLL_MIN_INTERVAL,
+        poll_max=HYSEN_2PFC_DEFAULT_POLL_MAX_INTERVAL,
+    ):
         """Initialize the Hysen HVACR device."""
         self._name = name
         self._host = host
         self._hysen_device = hysen_device
+        self._sessions = sessions
         self._preset_mode = PRESET_NONE
         self._device_available = False
-        self._device_authenticated = False
+        # a session kept from the last run skips the handshake until the device rejects it
+        self._session_restored = sessions.restore(hysen_device)
+        self._device_authenticated = self._session_restored
+        # sessions renegotiated by the device itself are persisted as well
+        hysen_device.on_session = partial(sessions.async_remember, hysen_device)
+        self._startup_task = None
+        self._startup_time = None
+        self._status_complete = False
+        self._room_temp_deadband = room_temp_deadband
+        self._room_temp = None
+        # what the last state written was made of
+        self._written_signature = None
+        self._written_status = None
+        # polled every poll_min seconds while active, twice as late after every
+        # quiet poll up to poll_max, every poll_max seconds while off
+        self._poll_min = poll_min
+        self._poll_max = poll_max
+        self._poll_interval = poll_min
+        self._poll_time = 0
+        self._polled_version = None
+        self._commanded = False
+        hysen_device.on_write = self._async_poll_soon
 
     @property
     def should_poll(self):
-        """Return the polling state."""
-        return True
+        """Return the polling state, the coordinator polls instead."""
+        return False
+
+    @property
+    def unique_id(self):
+        """Return the MAC address of the device."""
+        return self._hysen_device.mac.hex()
+
+    @property
+    def device_info(self):
+        """Return the device registry information."""
+        return {
+            "identifiers": {(HYSEN_2PFC_DOMAIN, self.unique_id)},
+            "name": self._name,
+            "manufacturer": "Hysen",
+            "model": "HY03AC",
+        }
 
     @property
     def name(self):
@@ -618,6 +1042,18 @@ class Hysen2PipeFanCoil(ClimateDevice):
                     ATTR_TIME_VALVE_ON: int(self._hysen_device.time_valve_on),
                 }
             )
+        # learned link timing in milliseconds
+        if self._hysen_device.rtt.srtt is not None:
+            attr[ATTR_ROUND_TRIP_TIME] = int(self._hysen_device.rtt.srtt * 1000)
+        attr[ATTR_RETRANSMISSION_TIMEOUT] = int(self._hysen_device.rtt.rto * 1000)
+        if self._hysen_device.hedge_reads:
+            attr[ATTR_HEDGES_SENT] = self._hysen_device.hedges_sent
+            attr[ATTR_HEDGES_WON] = self._hysen_device.hedges_won
+        attr[ATTR_AUTH_HANDSHAKES] = self._hysen_device.auths_sent
+        attr[ATTR_AUTH_HANDSHAKES_AVOIDED] = self._hysen_device.auths_avoided
+        if self._startup_time is not None:
+            attr[ATTR_STARTUP_TIME] = int(self._startup_time * 1000)
+        attr[ATTR_POLL_INTERVAL] = self._poll_interval
         return attr
 
     @property
@@ -677,8 +1113,10 @@ class Hysen2PipeFanCoil(ClimateDevice):
 
     @property
     def current_temperature(self):
-        """Returns the sensor temperature."""
-        return self._hysen_device.room_temp
+        """Returns the sensor temperature, moves only by room_temp_deadband or more."""
+        if self._room_temp is None:
+            return self._hysen_device.room_temp
+        return self._room_temp
 
     @property
     def target_temperature(self):
@@ -754,14 +1192,52 @@ class Hysen2PipeFanCoil(ClimateDevice):
     async def async_added_to_hass(self) -> None:
         """Run when entity about to added."""
         await super().async_added_to_hass()
-        await self.async_set_time_now()
+        self.hass.data[DATA_KEY_ENTITIES][self.entity_id] = self
+        self._startup_task = self.hass.async_create_task(self._async_startup())
+
+    async def _async_startup(self):
+        """Authenticate, read and set the clock, a few controllers at a time."""
+        try:
+            async with self.hass.data[DATA_KEY_STARTUP]:
+                _start = self.hass.loop.time()
+                await self._async_refresh()
+                self._startup_time = self.hass.loop.time() - _start
+            self._async_status_changed()
+            _LOGGER.debug(
+                "[%s] Device started in %.3f s, available: %s",
+                self._host,
+                self._startup_time,
+                self._device_available,
+            )
+        except Exception as exc:
+            # left to the coordinator polls, they retry like for any unavailable device
+            _LOGGER.error("[%s] Error in startup: %s", self._host, exc)
+            self._device_available = False
+        finally:
+            self._startup_task = None
+        await self.async_update_ha_state()
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Release the device and its sockets when entity is removed."""
+        devices = self.hass.data.get(DATA_KEY, {})
+        if devices.get(self.unique_id) is self:
+            del devices[self.unique_id]
+        entities = self.hass.data.get(DATA_KEY_ENTITIES, {})
+        if entities.get(self.entity_id) is self:
+            del entities[self.entity_id]
+        if self._startup_task is not None:
+            self._startup_task.cancel()
+        self._sessions.async_forget(self._hysen_device)
+        self._hysen_device.on_session = None
+        self._hysen_device.on_write = None
+        self._hysen_device.close()
+        if not devices:
+            _async_release_shared(self.hass)
 
     async def async_set_temperature(self, **kwargs):
         """Set new target temperature."""
         temp = int(kwargs.get(ATTR_TEMPERATURE))
-        await self._try_command(
-            "Error in set_temperature", self._hysen_device.set_target_temp, temp
-        )
+        await self._async_apply_later("Error in set_temperature", {"target_temp": temp})
         await self.async_update_ha_state()
 
     async def async_set_fan_mode(self, fan_mode):
@@ -773,10 +1249,8 @@ class Hysen2PipeFanCoil(ClimateDevice):
                 fan_mode,
             )
             return
-        await self._try_command(
-            "Error in set_fan_mode",
-            self._hysen_device.set_fan_mode,
-            HASS_FAN_TO_HYSEN[fan_mode.lower()],
+        await self._async_apply_later(
+            "Error in set_fan_mode", {"fan_mode": HASS_FAN_TO_HYSEN[fan_mode.lower()]}
         )
         await self.async_update_ha_state()
 
@@ -796,32 +1270,15 @@ class Hysen2PipeFanCoil(ClimateDevice):
             return
         _LOGGER.debug("async_set_hvac_mode: %s", hvac_mode)
         if hvac_mode.lower() == HVAC_MODE_OFF:
-            await self._try_command(
-            "Error in turn_off",
-            self._hysen_device.set_power,
-            HASS_POWER_STATE_TO_HYSEN[False])
-        elif hvac_mode.lower() == HVAC_MODE_FAN_ONLY and self._hysen_device.fan_mode == HYSEN_2PFC_FAN_AUTO:
-            await self._try_command(
-                "Error in set_fan_mode",
-                self._hysen_device.set_fan_mode,
-                HYSEN_2PFC_FAN_LOW,
-            )
-            await self._try_command(
-                "Error in set_operation_mode",
-                self._hysen_device.set_operation_mode,
-                HASS_MODE_TO_HYSEN[hvac_mode.lower()],
-            )
+            desired_state = {"power_state": HASS_POWER_STATE_TO_HYSEN[False]}
         else:
-            if self._hysen_device.power_state == HYSEN_2PFC_POWER_OFF:
-                await self._try_command(
-                "Error in turn_on",
-                self._hysen_device.set_power,
-                HASS_POWER_STATE_TO_HYSEN[True])
-            await self._try_command(
-                "Error in set_operation_mode",
-                self._hysen_device.set_operation_mode,
-                HASS_MODE_TO_HYSEN[hvac_mode.lower()],
-            )
+            desired_state = {
+                "power_state": HASS_POWER_STATE_TO_HYSEN[True],
+                "operation_mode": HASS_MODE_TO_HYSEN[hvac_mode.lower()],
+            }
+            if hvac_mode.lower() == HVAC_MODE_FAN_ONLY and self._hysen_device.fan_mode == HYSEN_2PFC_FAN_AUTO:
+                desired_state["fan_mode"] = HYSEN_2PFC_FAN_LOW
+        await self._async_apply_later("Error in set_hvac_mode", desired_state)
         await self.async_update_ha_state()
 
     async def async_turn_on(self):
@@ -842,13 +1299,14 @@ class Hysen2PipeFanCoil(ClimateDevice):
                 self._host,
                 key_lock,
             )
-            return
-        await self._try_command(
+            return False
+        _result = await self._try_command(
             "Error in set_remote_lock",
-            self._hysen_device.set_remote_lock,
+            self._hysen_device.async_set_remote_lock,
             HASS_KEY_LOCK_TO_HYSEN[key_lock.lower()],
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_hysteresis(self, hysteresis):
         """Set hysteresis. 0 = 0.5 degree Celsius, 1 = 1 degree Celsius"""
@@ -858,92 +1316,96 @@ class Hysen2PipeFanCoil(ClimateDevice):
                 self._host,
                 hysteresis,
             )
-            return
-        await self._try_command(
+            return False
+        _result = await self._try_command(
             "Error in set_hysteresis",
-            self._hysen_device.set_hysteresis,
+            self._hysen_device.async_set_hysteresis,
             HASS_HYSTERESIS_TO_HYSEN[hysteresis.lower()],
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_calibration(self, calibration):
         """Set temperature calibration. Range -5~+5 degree Celsius in 0.1 degree Celsius step."""
-        await self._try_command(
-            "Error in set_calibration", self._hysen_device.set_calibration, calibration
+        _result = await self._try_command(
+            "Error in set_calibration", self._hysen_device.async_set_calibration, calibration
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_cooling_max_temp(self, temp):
         """Set cooling upper limit."""
-        await self._try_command(
+        _result = await self._try_command(
             "Error in set_cooling_max_temp",
-            self._hysen_device.set_cooling_max_temp,
+            self._hysen_device.async_set_cooling_max_temp,
             temp,
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_cooling_min_temp(self, temp):
         """Set cooling lower limit."""
-        await self._try_command(
+        _result = await self._try_command(
             "Error in set_cooling_min_temp",
-            self._hysen_device.set_cooling_min_temp,
+            self._hysen_device.async_set_cooling_min_temp,
             temp,
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_heating_max_temp(self, temp):
         """Set heating upper limit."""
-        await self._try_command(
+        _result = await self._try_command(
             "Error in set_heating_max_temp",
-            self._hysen_device.set_heating_max_temp,
+            self._hysen_device.async_set_heating_max_temp,
             temp,
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_heating_min_temp(self, temp):
         """Set heating lower limit."""
-        await self._try_command(
+        _result = await self._try_command(
             "Error in set_heating_min_temp",
-            self._hysen_device.set_heating_min_temp,
+            self._hysen_device.async_set_heating_min_temp,
             temp,
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_fan_control(self, fan_control):
         """Set fan coil control mode, 0 = Fan is stopped when target temp reached, 1 = Fan is spinning when target temp reached."""
-        await self._try_command(
+        _result = await self._try_command(
             "Error in set_fan_control",
-            self._hysen_device.set_fan_control,
+            self._hysen_device.async_set_fan_control,
             HASS_FAN_CONTROL_TO_HYSEN[fan_control],
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_frost_protection(self, frost_protection):
         """Set frost_protection 0 = Off, 1 = When power off keeps the room temp between 5 to 7 degree."""
-        await self._try_command(
+        _result = await self._try_command(
             "Error in set_frost_protection",
-            self._hysen_device.set_frost_protection,
+            self._hysen_device.async_set_frost_protection,
             HASS_FROST_PROTECTION_TO_HYSEN[frost_protection],
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_time_now(self):
         """Set device time to system time."""
-        clock_weekday = int(dt_util.as_local(dt_util.now()).strftime("%w"))
-        if clock_weekday == 0:
-            clock_weekday = 7
-        clock_hour = int(dt_util.as_local(dt_util.now()).strftime("%H"))
-        clock_min = int(dt_util.as_local(dt_util.now()).strftime("%M"))
-        clock_sec = int(dt_util.as_local(dt_util.now()).strftime("%S"))
-        await self._try_command(
+        _now = dt_util.as_local(dt_util.now())
+        _result = await self._try_command(
             "Error in set_time",
-            self._hysen_device.set_time,
-            clock_hour,
-            clock_min,
-            clock_sec,
-            clock_weekday,
+            self._hysen_device.async_set_time,
+            _now.hour,
+            _now.minute,
+            _now.second,
+            _now.isoweekday(),
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_schedule(self, schedule):
         """Set schedule mode 0 = Today 1 = 12345,67 2 = 123456,7 3 = 1234567."""
@@ -953,93 +1415,202 @@ class Hysen2PipeFanCoil(ClimateDevice):
                 self._host,
                 schedule,
             )
-            return
-        await self._try_command(
+            return False
+        _result = await self._try_command(
             "Error in set_weekly_schedule",
-            self._hysen_device.set_weekly_schedule,
+            self._hysen_device.async_set_weekly_schedule,
             HASS_SCHEDULE_TO_HYSEN[schedule.lower()],
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_period1_on(self, enable=None, hour=None, min=None):
         """Set period 1 start."""
-        await self._try_command(
+        _result = await self._try_command(
             "Error in set_period1_on",
-            self._hysen_device.set_period1_on,
+            self._hysen_device.async_set_period1_on,
             HASS_PERIOD_ENABLED_TO_HYSEN[enable],
             hour,
             min,
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_period1_off(self, enable=None, hour=None, min=None):
         """Set period 1 end."""
-        await self._try_command(
+        _result = await self._try_command(
             "Error in set_period1_off",
-            self._hysen_device.set_period1_off,
+            self._hysen_device.async_set_period1_off,
             HASS_PERIOD_ENABLED_TO_HYSEN[enable],
             hour,
             min,
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_period2_on(self, enable=None, hour=None, min=None):
         """Set period 2 start."""
-        await self._try_command(
+        _result = await self._try_command(
             "Error in set_period2_on",
-            self._hysen_device.set_period2_on,
+            self._hysen_device.async_set_period2_on,
             HASS_PERIOD_ENABLED_TO_HYSEN[enable],
             hour,
             min,
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_set_period2_off(self, enable=None, hour=None, min=None):
         """Set period 2 end."""
-        await self._try_command(
+        _result = await self._try_command(
             "Error in set_period2_off",
-            self._hysen_device.set_period2_off,
+            self._hysen_device.async_set_period2_off,
             HASS_PERIOD_ENABLED_TO_HYSEN[enable],
             hour,
             min,
         )
         await self.async_update_ha_state()
+        return _result
 
     async def async_authenticate_device(self):
         """Connect to device ."""
-        try:
-            _authenticated = await self.hass.async_add_executor_job(
-                self._hysen_device.auth
-            )
-            if _authenticated:
-                _LOGGER.debug("[%s] Device authenticated.", self._host)
-            else:
-                _LOGGER.debug("[%s] Device not authenticated.", self._host)
-        except Exception as exc:
-            _LOGGER.error("[%s] Device authentication error: %s", self._host, exc)
-            _authenticated = False
+        _authenticated = await self._hysen_device.async_reauth()
+        if _authenticated:
+            _LOGGER.debug("[%s] Device authenticated.", self._host)
+        else:
+            _LOGGER.debug("[%s] Device not authenticated.", self._host)
         return _authenticated
 
     async def async_get_device_status(self):
         """Get device status."""
         await self._try_command(
-            "Error in get_device_status", self._hysen_device.get_device_status
+            "Error in get_device_status", self._hysen_device.async_get_device_status
         )
 
+    async def async_poll_device_status(self):
+        """Get the status words due for this poll."""
+        self._status_complete = False
+        await self._try_command("Error in get_device_status", self._async_poll_status)
+
+    async def _async_poll_status(self):
+        self._status_complete = await self._hysen_device.async_poll_status()
+
     async def _try_command(self, mask_error, func, *args, **kwargs):
-        """Calls a device command and handle error messages."""
+        """Calls a device command and handle error messages, returns True on success."""
         self._device_available = True
         try:
-            await self.hass.async_add_executor_job(partial(func, *args, **kwargs))
+            await func(*args, **kwargs)
         except socket.timeout as timeout_error:
             _LOGGER.error("[%s] %s: %s", self._host, mask_error, timeout_error)
             self._device_available = False
         except Exception as exc:
             _LOGGER.error("[%s] %s: %s", self._host, mask_error, exc)
             self._device_available = False
+        return self._device_available
+
+    async def _async_apply_later(self, mask_error, desired_state):
+        """Show desired_state at once, write it when the user stopped changing it."""
+        try:
+            write = self._hysen_device.apply_later(desired_state)
+        except ValueError as exc:
+            _LOGGER.error("[%s] %s: %s", self._host, mask_error, exc)
+            return False
+        self.async_write_ha_state()
+        # a cancelled caller must not cancel the write others may wait for
+        return await self._try_command(mask_error, asyncio.shield, write)
+
+    async def async_poll(self):
+        """Refresh for the coordinator, returns True if the state has to be written."""
+        if self._startup_task is not None:
+            return False
+        await self._async_refresh()
+        self._async_schedule_poll()
+        return self._async_status_changed()
+
+    @callback
+    def poll_due(self, now):
+        """Return True if the device is to be polled at loop time now."""
+        return now >= self._poll_time
+
+    @callback
+    def _async_schedule_poll(self):
+        """Poll soon again if the status moved, later every time it did not."""
+        _version = self._hysen_device.control_version
+        if self._commanded:
+            self._poll_interval = self._poll_min
+        elif not self._device_available:
+            self._poll_interval = min(2 * self._poll_interval, self._poll_max)
+        elif self._hysen_device.status.power_state == HYSEN_2PFC_POWER_OFF:
+            self._poll_interval = self._poll_max
+        elif _version != self._polled_version:
+            self._poll_interval = self._poll_min
+        else:
+            self._poll_interval = min(2 * self._poll_interval, self._poll_max)
+        self._commanded = False
+        self._polled_version = _version
+        self._poll_time = self.hass.loop.time() + self._poll_interval
+        # the device switching itself by its periods is read right after
+        _transition = self._hysen_device.next_transition()
+        if _transition is not None:
+            _transition_time = self.hass.loop.time() + _transition + TRANSITION_POLL_DELAY
+            if _transition_time < self._poll_time:
+                self._poll_time = _transition_time
+                _coordinator = self.hass.data.get(DATA_KEY_COORDINATOR)
+                if _coordinator is not None:
+                    _coordinator.async_poll_at(self, _transition_time)
+
+    @callback
+    def _async_poll_soon(self):
+        """A command was written, follow the device closely again."""
+        self._commanded = True
+        self._poll_interval = self._poll_min
+        self._poll_time = min(self._poll_time, self.hass.loop.time() + self._poll_min)
+
+    @callback
+    def _async_status_changed(self):
+        """Fire the transition events of a new status, returns True if it is shown."""
+        _signature = (self._device_available, self._hysen_device.registers_version)
+        if _signature == self._written_signature:
+            return False
+        self._written_signature = _signature
+        if not self._device_available:
+            return True
+        _status = self._hysen_device.status
+        _previous = self._written_status
+        self._written_status = _status
+        if self._room_temp is None or abs(
+            _status.room_temp - self._room_temp
+        ) >= self._room_temp_deadband:
+            self._room_temp = _status.room_temp
+        elif _previous is not None and _status._replace(
+            **STATE_IGNORED_FIELDS
+        ) == _previous._replace(**STATE_IGNORED_FIELDS):
+            return False
+        if _previous is not None:
+            for _field, _to_hass in TRANSITION_FIELDS.items():
+                _old = getattr(_previous, _field)
+                _new = getattr(_status, _field)
+                if _old != _new:
+                    self.hass.bus.async_fire(
+                        EVENT_TRANSITION,
+                        {
+                            ATTR_ENTITY_ID: self.entity_id,
+                            ATTR_ATTRIBUTE: _field,
+                            ATTR_OLD_STATE: _to_hass[_old],
+                            ATTR_NEW_STATE: _to_hass[_new],
+                        },
+                    )
+        return True
 
     async def async_update(self):
         """Get the latest state from the device."""
+        # polls before the startup completed would bypass its concurrency limit
+        if self._startup_task is not None:
+            return
+        await self._async_refresh()
+        self._async_status_changed()
+
+    async def _async_refresh(self):
         if self._device_authenticated is False:
             self._device_authenticated = await self.async_authenticate_device()
             if self._device_authenticated is False:
@@ -1047,20 +1618,19 @@ class Hysen2PipeFanCoil(ClimateDevice):
             if self._device_available:
                 self._device_authenticated = True
         if self._device_authenticated:
-            await self.async_get_device_status()
-            _weekday = int(dt_util.as_local(dt_util.now()).strftime("%w"))
-            if self._device_available:
-                if _weekday == 0:
-                    _weekday = 7
-                if (
-                    (self._hysen_device.clock_weekday != _weekday)
-                    or (
-                        self._hysen_device.clock_hour
-                        != int(dt_util.as_local(dt_util.now()).strftime("%H"))
-                    )
-                    or (
-                        self._hysen_device.clock_min
-                        != int(dt_util.as_local(dt_util.now()).strftime("%M"))
-                    )
-                ):
+            await self.async_poll_device_status()
+            if self._session_restored:
+                self._session_restored = False
+                if not self._device_available:
+                    _LOGGER.debug("[%s] Stored session rejected.", self._host)
+                    self._device_authenticated = await self.async_authenticate_device()
+                    if self._device_authenticated:
+                        await self.async_get_device_status()
+                        self._status_complete = self._device_available
+            # the clock words are only read along with the whole status, the clock
+            # is set once its predicted error grew too large
+            if self._device_available and self._status_complete:
+                _error = self._hysen_device.clock_error(dt_util.as_local(dt_util.now()))
+                if _error is not None and abs(_error) > HYSEN_2PFC_CLOCK_MAX_ERROR:
+                    _LOGGER.debug("[%s] Clock off by %.1f s", self._host, _error)
                     await self.async_set_time_now()
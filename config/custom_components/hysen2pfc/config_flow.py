@@ -0,0 +1,255 @@
+"""
+Config flow for Hysen Controller for 2 Pipe Fan Coil units.
+Controllers found by a discovery broadcast are offered first, any other can be
+entered by hand; configuration.yaml platforms are imported.
+"""
+import binascii
+import logging
+
+import voluptuous as vol
+
+from homeassistant import config_entries
+from homeassistant.const import (
+    CONF_HOST,
+    CONF_MAC,
+    CONF_NAME,
+    CONF_SCAN_INTERVAL,
+    CONF_TIMEOUT,
+)
+import homeassistant.helpers.config_validation as cv
+
+from .const import (
+    DOMAIN,
+    HYSEN_2PFC_DEFAULT_NAME,
+    HYSEN_2PFC_DEFAULT_TIMEOUT,
+    CONF_SHARED_SOCKET,
+    CONF_HEDGE_READS,
+    CONF_ROOM_TEMP_DEADBAND,
+    HYSEN_2PFC_DEFAULT_ROOM_TEMP_DEADBAND,
+    CONF_POLL_MIN_INTERVAL,
+    CONF_POLL_MAX_INTERVAL,
+    HYSEN_2PFC_DEFAULT_POLL_MIN_INTERVAL,
+    HYSEN_2PFC_DEFAULT_POLL_MAX_INTERVAL,
+    HYSEN_2PFC_MIN_POLL_INTERVAL,
+)
+from .hysen2pfc_device import Hysen2PipeFanCoilDevice, HYSEN_2PFC_DEV_TYPE
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_DEVICE = "device"
+MANUAL_ENTRY = "manual"
+
+ENTRY_KEYS = (
+    CONF_HOST,
+    CONF_MAC,
+    CONF_NAME,
+    CONF_TIMEOUT,
+    CONF_SHARED_SOCKET,
+    CONF_HEDGE_READS,
+    CONF_ROOM_TEMP_DEADBAND,
+    CONF_POLL_MIN_INTERVAL,
+    CONF_POLL_MAX_INTERVAL,
+)
+
+
+def _import_data(import_config):
+    """Return the entry data of a configuration.yaml platform.
+
+    scan_interval no longer applies, the controllers are polled at an interval
+    adapted to their activity; it becomes the shortest poll interval unless
+    poll_min_interval is set.
+    """
+    data = {key: import_config[key] for key in ENTRY_KEYS if key in import_config}
+    data.setdefault(CONF_NAME, HYSEN_2PFC_DEFAULT_NAME)
+    scan_interval = import_config.get(CONF_SCAN_INTERVAL)
+    if scan_interval is None:
+        return data
+    if CONF_POLL_MIN_INTERVAL in data:
+        _LOGGER.warning(
+            "[%s] %s is no longer supported and ignored, %s applies",
+            data[CONF_HOST],
+            CONF_SCAN_INTERVAL,
+            CONF_POLL_MIN_INTERVAL,
+        )
+        return data
+    poll_min = max(int(scan_interval.total_seconds()), HYSEN_2PFC_MIN_POLL_INTERVAL)
+    _LOGGER.warning(
+        "[%s] %s is no longer supported, %d s is used as %s",
+        data[CONF_HOST],
+        CONF_SCAN_INTERVAL,
+        poll_min,
+        CONF_POLL_MIN_INTERVAL,
+    )
+    data[CONF_POLL_MIN_INTERVAL] = poll_min
+    # a cadence slower than the longest poll interval is kept as it was
+    poll_max = data.get(CONF_POLL_MAX_INTERVAL, HYSEN_2PFC_DEFAULT_POLL_MAX_INTERVAL)
+    if poll_min > poll_max:
+        data[CONF_POLL_MAX_INTERVAL] = poll_min
+    return data
+
+
+def _mac_address(mac):
+    """Return the 6 bytes of a MAC written as hex digits, with or without colons."""
+    mac_addr = binascii.unhexlify(mac.encode().replace(b":", b""))
+    if len(mac_addr) != 6:
+        raise ValueError(mac)
+    return mac_addr
+
+
+class Hysen2PipeFanCoilFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
+    """Handle a config flow for a Hysen 2 pipe fan coil controller."""
+
+    VERSION = 1
+    CONNECTION_CLASS = config_entries.CONN_CLASS_LOCAL_POLL
+
+    def __init__(self):
+        """Initialize the flow."""
+        self._discovered = {}
+
+    async def async_step_user(self, user_input=None):
+        """Offer the controllers answering a discovery broadcast."""
+        if user_input is not None:
+            if user_input[CONF_DEVICE] == MANUAL_ENTRY:
+                return await self.async_step_manual()
+            device = self._discovered[user_input[CONF_DEVICE]]
+            return await self.async_step_manual(
+                {
+                    CONF_HOST: device.host[0],
+                    CONF_MAC: ":".join(format(x, "02x") for x in device.mac),
+                    CONF_NAME: device.name or HYSEN_2PFC_DEFAULT_NAME,
+                }
+            )
+
+        configured = {entry.unique_id for entry in self._async_current_entries()}
+        try:
+            found = await Hysen2PipeFanCoilDevice.async_discover()
+        except OSError as exc:
+            _LOGGER.debug("Discovery failed: %s", exc)
+            found = []
+        self._discovered = {
+            device.mac.hex(): device
+            for device in found
+            if device.mac.hex() not in configured
+        }
+        if not self._discovered:
+            return await self.async_step_manual()
+
+        choices = {
+            mac: "%s (%s)" % (device.name or mac, device.host[0])
+            for mac, device in self._discovered.items()
+        }
+        choices[MANUAL_ENTRY] = "Enter manually"
+        return self.async_show_form(
+            step_id="user",
+            data_schema=vol.Schema({vol.Required(CONF_DEVICE): vol.In(choices)}),
+        )
+
+    async def async_step_manual(self, user_input=None):
+        """Configure a controller by host and MAC, it has to answer a handshake."""
+        errors = {}
+        if user_input is not None:
+            try:
+                mac_addr = _mac_address(user_input[CONF_MAC])
+            except ValueError:
+                errors[CONF_MAC] = "invalid_mac"
+            poll_min = user_input.get(
+                CONF_POLL_MIN_INTERVAL, HYSEN_2PFC_DEFAULT_POLL_MIN_INTERVAL
+            )
+            poll_max = user_input.get(
+                CONF_POLL_MAX_INTERVAL, HYSEN_2PFC_DEFAULT_POLL_MAX_INTERVAL
+            )
+            if poll_min > poll_max:
+                errors[CONF_POLL_MAX_INTERVAL] = "invalid_poll_interval"
+            if not errors:
+                await self.async_set_unique_id(mac_addr.hex())
+                self._abort_if_unique_id_configured()
+                if await self._async_try_connect(user_input, mac_addr):
+                    return self._create_entry(user_input)
+                errors["base"] = "cannot_connect"
+        else:
+            user_input = {}
+
+        data_schema = vol.Schema(
+            {
+                vol.Required(CONF_HOST, default=user_input.get(CONF_HOST, "")): str,
+                vol.Required(CONF_MAC, default=user_input.get(CONF_MAC, "")): str,
+                vol.Optional(
+                    CONF_NAME, default=user_input.get(CONF_NAME, HYSEN_2PFC_DEFAULT_NAME)
+                ): str,
+                vol.Optional(
+                    CONF_TIMEOUT,
+                    default=user_input.get(CONF_TIMEOUT, HYSEN_2PFC_DEFAULT_TIMEOUT),
+                ): cv.positive_int,
+                vol.Optional(
+                    CONF_SHARED_SOCKET, default=user_input.get(CONF_SHARED_SOCKET, True)
+                ): bool,
+                vol.Optional(
+                    CONF_HEDGE_READS, default=user_input.get(CONF_HEDGE_READS, False)
+                ): bool,
+                vol.Optional(
+                    CONF_ROOM_TEMP_DEADBAND,
+                    default=user_input.get(
+                        CONF_ROOM_TEMP_DEADBAND, HYSEN_2PFC_DEFAULT_ROOM_TEMP_DEADBAND
+                    ),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                vol.Optional(
+                    CONF_POLL_MIN_INTERVAL,
+                    default=user_input.get(
+                        CONF_POLL_MIN_INTERVAL, HYSEN_2PFC_DEFAULT_POLL_MIN_INTERVAL
+                    ),
+                ): vol.All(
+                    vol.Coerce(int), vol.Range(min=HYSEN_2PFC_MIN_POLL_INTERVAL)
+                ),
+                vol.Optional(
+                    CONF_POLL_MAX_INTERVAL,
+                    default=user_input.get(
+                        CONF_POLL_MAX_INTERVAL, HYSEN_2PFC_DEFAULT_POLL_MAX_INTERVAL
+                    ),
+                ): vol.All(
+                    vol.Coerce(int), vol.Range(min=HYSEN_2PFC_MIN_POLL_INTERVAL)
+                ),
+            }
+        )
+        return self.async_show_form(
+            step_id="manual", data_schema=data_schema, errors=errors
+        )
+
+    async def async_step_import(self, import_config):
+        """Import a controller from configuration.yaml, it may be offline right now."""
+        try:
+            mac_addr = _mac_address(import_config[CONF_MAC])
+        except ValueError:
+            _LOGGER.error("Invalid MAC address %s", import_config[CONF_MAC])
+            return self.async_abort(reason="invalid_mac")
+        await self.async_set_unique_id(mac_addr.hex())
+        data = _import_data(import_config)
+        # changes to configuration.yaml are carried over to the imported entry
+        for entry in self._async_current_entries():
+            if entry.unique_id != self.unique_id:
+                continue
+            if entry.data != data or entry.title != data[CONF_NAME]:
+                self.hass.config_entries.async_update_entry(
+                    entry, title=data[CONF_NAME], data=data
+                )
+                self.hass.async_create_task(
+                    self.hass.config_entries.async_reload(entry.entry_id)
+                )
+            return self.async_abort(reason="already_configured")
+        return self.async_create_entry(title=data[CONF_NAME], data=data)
+
+    def _create_entry(self, config):
+        data = {key: config[key] for key in ENTRY_KEYS if key in config}
+        data.setdefault(CONF_NAME, HYSEN_2PFC_DEFAULT_NAME)
+        return self.async_create_entry(title=data[CONF_NAME], data=data)
+
+    async def _async_try_connect(self, config, mac_addr):
+        hysen_device = Hysen2PipeFanCoilDevice(
+            (config[CONF_HOST], 80),
+            mac_addr,
+            HYSEN_2PFC_DEV_TYPE,
+            config.get(CONF_TIMEOUT, HYSEN_2PFC_DEFAULT_TIMEOUT),
+        )
+        try:
+            return await hysen_device.async_reauth()
+        finally:
+            hysen_device.close()
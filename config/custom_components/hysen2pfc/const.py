@@ -0,0 +1,24 @@
+"""
+Constants shared by the Hysen 2 pipe fan coil integration, its climate platform
+and its config flow
+"""
+
+DOMAIN = "hysen2pfc"
+
+HYSEN_2PFC_DEFAULT_NAME = "Hysen 2 Pipe Fan Coil Thermostat"
+HYSEN_2PFC_DEFAULT_TIMEOUT = 10
+
+CONF_SHARED_SOCKET = "shared_socket"
+CONF_HEDGE_READS = "hedge_reads"
+CONF_ROOM_TEMP_DEADBAND = "room_temp_deadband"
+
+HYSEN_2PFC_DEFAULT_ROOM_TEMP_DEADBAND = 0.0
+
+CONF_POLL_MIN_INTERVAL = "poll_min_interval"
+CONF_POLL_MAX_INTERVAL = "poll_max_interval"
+
+# Seconds between polls of a controller, the shortest while it is active
+HYSEN_2PFC_DEFAULT_POLL_MIN_INTERVAL = 10
+HYSEN_2PFC_DEFAULT_POLL_MAX_INTERVAL = 120
+# Controllers are looked at every 5 s, a shorter interval would not be honoured
+HYSEN_2PFC_MIN_POLL_INTERVAL = 5
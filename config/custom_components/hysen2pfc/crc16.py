@@ -0,0 +1,28 @@
+"""
+CRC16/Modbus
+Polynomial 0xA001 (reflected 0x8005), initial value 0xFFFF, table driven
+"""
+
+
+def _crc16_modbus_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_MODBUS_TABLE = _crc16_modbus_table()
+
+
+# data can be bytes, bytearray or a memoryview slice, nothing is copied
+def crc16_modbus(data, crc=0xFFFF):
+    table = CRC16_MODBUS_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
@@ -4,24 +4,165 @@ Based on the work from
 https://github.com/mjg59/python-broadlink
 """
 
+import asyncio
+import collections
+import operator
 import random
 import socket
+import struct
 import threading
 import time
-from PyCRC.CRC16 import CRC16
 
-try:
-    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-    from cryptography.hazmat.backends import default_backend
-except ImportError:
-    import pyaes
+from .broadlink_crypto import broadlink_cipher
+from .broadlink_discovery import BROADLINK_DISCOVERY_TIMEOUT, broadlink_discover
+from .crc16 import crc16_modbus
+from .broadlink_frame import (
+    BROADLINK_HEADER_LEN,
+    broadlink_checksum,
+    broadlink_frame,
+    broadlink_pad,
+    broadlink_reply_count,
+)
 
 import logging
 
 _LOGGER = logging.getLogger(__name__)
 
+# Retransmission timeout bounds in seconds
+# The first request waits as long as the original fixed resend interval
+BROADLINK_RTO_INITIAL = 1.0
+BROADLINK_RTO_MIN = 0.05
+BROADLINK_RTO_MAX = 4.0
+
+# Latency samples kept per device, and how many are needed before hedging reads
+BROADLINK_RTT_SAMPLES = 64
+BROADLINK_RTT_MIN_SAMPLES = 10
+
+# Re-authentication pacing in seconds
+# Failed handshakes are retried no sooner than the backoff delay
+BROADLINK_AUTH_BACKOFF_MIN = 1.0
+BROADLINK_AUTH_BACKOFF_MAX = 60.0
+
+# Key and id every session starts from, the handshake is encrypted with them
+BROADLINK_DEFAULT_KEY = bytes(
+    [0x09, 0x76, 0x28, 0x34, 0x3f, 0xe9, 0x9e, 0x23, 0x76, 0x5c, 0x15, 0x13, 0xac, 0xcf, 0x8b, 0x02])
+BROADLINK_DEFAULT_ID = bytes(4)
+
+# Error reported at 0x22 when the device no longer accepts the session key
+BROADLINK_ERROR_AUTHORIZATION = 0xfff9
+
+class broadlink_rtt:
+    """Round trip time estimator setting the resend interval of one device.
+
+    Follows RFC 6298: smoothed RTT and RTT variance, no samples taken from
+    retransmitted requests (Karn's rule), timeout doubled on every expiry.
+    """
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = BROADLINK_RTO_INITIAL
+        self.samples = collections.deque(maxlen=BROADLINK_RTT_SAMPLES)
+
+    def sample(self, rtt):
+        self.samples.append(rtt)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, BROADLINK_RTO_MIN), BROADLINK_RTO_MAX)
+
+    def backoff(self):
+        self.rto = min(self.rto * 2, BROADLINK_RTO_MAX)
+
+    # observed latency below which the given fraction of replies arrived
+    def percentile(self, fraction):
+        if len(self.samples) < BROADLINK_RTT_MIN_SAMPLES:
+            return None
+        samples = sorted(self.samples)
+        return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+class broadlink_protocol(asyncio.DatagramProtocol):
+    """Asyncio UDP endpoint routing replies back to the request waiting for them.
+
+    One instance is normally shared by every device of the integration, a device
+    created without one opens its own. Replies are matched by source address and
+    the packet count echoed at 0x28, the MAC at 0x2a guards against misrouting.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.pending = {}
+        self.lock = None
+        # late replies to timed out requests and duplicates of answered ones
+        self.stale_datagrams = 0
+
+    async def async_open(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if self.transport is None:
+                loop = asyncio.get_running_loop()
+                await loop.create_datagram_endpoint(
+                    lambda: self,
+                    local_addr=('0.0.0.0', 0),
+                    allow_broadcast=True)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        self.transport = None
+
+    def expect(self, addr, mac, count):
+        future = asyncio.get_running_loop().create_future()
+        self.pending[(addr, count)] = (future, mac)
+        return future
+
+    def forget(self, addr, count):
+        self.pending.pop((addr, count), None)
+
+    # Fail every exchange still waiting for a reply from addr
+    def abort(self, addr, exc):
+        for key in [key for key in self.pending if key[0] == addr]:
+            future, _mac = self.pending.pop(key)
+            if not future.done():
+                future.set_exception(exc)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < BROADLINK_HEADER_LEN:
+            return
+        key = (addr[0:2], broadlink_reply_count(data))
+        entry = self.pending.get(key)
+        if entry is None:
+            self.stale_datagrams += 1
+            return
+        future, mac = entry
+        # devices report their MAC in either byte order, older firmware leaves it blank
+        reply_mac = bytes(data[0x2a:0x30])
+        if reply_mac not in (bytes(mac), bytes(mac[::-1]), bytes(6)):
+            self.stale_datagrams += 1
+            return
+        del self.pending[key]
+        if not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        _LOGGER.debug("UDP endpoint error: %s", exc)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        pending, self.pending = self.pending, {}
+        for future, _mac in pending.values():
+            if not future.done():
+                future.set_exception(exc or ConnectionError('transport closed'))
+
 class broadlink_device:
-    def __init__(self, host, mac, devtype, timeout=10):
+    def __init__(self, host, mac, devtype, timeout=10, protocol=None, hedge_reads=False):
         self.host = host
         self.mac = mac.encode() if isinstance(mac, str) else mac
         self.devtype = devtype
@@ -30,50 +171,70 @@ class broadlink_device:
         self.iv = bytearray(
             [0x56, 0x2e, 0x17, 0x99, 0x6d, 0x09, 0x3d, 0x28, 0xdd, 0xb3, 0xba, 0x69, 0x5a, 0x2e, 0x6f, 0x58])
         self.id = bytearray([0, 0, 0, 0])
-        self.cs = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.cs.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.cs.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        self.cs.bind(('', 0))
+        self.frame = broadlink_frame(self.mac)
+        self.cs = None
+        self.buffer = bytearray(2048)
         self.type = "Unknown"
         self.lock = threading.Lock()
-
-        if 'pyaes' in globals():
-            self.encrypt = self.encrypt_pyaes
-            self.decrypt = self.decrypt_pyaes
-            self.update_aes = self.update_aes_pyaes
-
-        else:
-            self.encrypt = self.encrypt_crypto
-            self.decrypt = self.decrypt_crypto
-            self.update_aes = self.update_aes_crypto
+        # without a shared endpoint the device falls back to a socket of its own
+        self.shared_protocol = protocol is not None
+        self.protocol = protocol if protocol is not None else broadlink_protocol()
+        self.addr = None
+        self.async_lock = None
+        self.stale_datagrams = 0
+        self.rtt = broadlink_rtt()
+        # a read still unanswered at the p90 latency is sent again, first reply wins
+        self.hedge_reads = hedge_reads
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        # one handshake in flight at a time, concurrent re-auth triggers wait for it
+        self.auth_task = None
+        self.auth_result = False
+        # bumped on every session change, a rejection is only renegotiated when
+        # it hit the current session
+        self.session_generation = 0
+        self.auth_retry_time = 0
+        self.auth_backoff = BROADLINK_AUTH_BACKOFF_MIN
+        self.auths_sent = 0
+        self.auths_avoided = 0
+        # called after every successful re-authentication, e.g. to persist the session
+        self.on_session = None
 
         self.aes = None
-        key = bytearray(
-            [0x09, 0x76, 0x28, 0x34, 0x3f, 0xe9, 0x9e, 0x23, 0x76, 0x5c, 0x15, 0x13, 0xac, 0xcf, 0x8b, 0x02])
+        self.key = None
+        self.update_aes(BROADLINK_DEFAULT_KEY)
+
+    def update_aes(self, key):
+        self.key = bytes(key)
+        self.aes = broadlink_cipher(key, self.iv)
+
+    # Session negotiated by auth(), kept by the caller so that a restart can skip the handshake
+    def get_session(self):
+        return {
+            'id': bytes(self.id).hex(),
+            'key': self.key.hex(),
+            'count': self.count,
+        }
+
+    def set_session(self, session):
+        id = bytearray.fromhex(session['id'])
+        key = bytes.fromhex(session['key'])
+        if len(id) != 4 or len(key) != 16:
+            raise ValueError('Invalid session (%s).' % session)
+        self.id = id
+        self.frame.set_id(self.id)
         self.update_aes(key)
+        self.count = int(session['count']) & 0xffff
+        self.session_generation += 1
+        self.auth_result = True
 
-    def update_aes_pyaes(self, key):
-        self.aes = pyaes.AESModeOfOperationCBC(key, iv=bytes(self.iv))
-
-    def encrypt_pyaes(self, payload):
-        return b"".join([self.aes.encrypt(bytes(payload[i:i + 16])) for i in range(0, len(payload), 16)])
-
-    def decrypt_pyaes(self, payload):
-        return b"".join([self.aes.decrypt(bytes(payload[i:i + 16])) for i in range(0, len(payload), 16)])
+    def encrypt(self, payload):
+        return self.aes.encrypt(payload)
 
-    def update_aes_crypto(self, key):
-        self.aes = Cipher(algorithms.AES(key), modes.CBC(self.iv),
-                          backend=default_backend())
+    def decrypt(self, payload):
+        return self.aes.decrypt(payload)
 
-    def encrypt_crypto(self, payload):
-        encryptor = self.aes.encryptor()
-        return encryptor.update(payload) + encryptor.finalize()
-
-    def decrypt_crypto(self, payload):
-        decryptor = self.aes.decryptor()
-        return decryptor.update(payload) + decryptor.finalize()
-
-    def auth(self):
+    def _auth_payload(self):
         payload = bytearray(0x50)
         payload[0x04] = 0x31
         payload[0x05] = 0x31
@@ -99,10 +260,10 @@ class broadlink_device:
         payload[0x34] = ord(' ')
         payload[0x35] = ord(' ')
         payload[0x36] = ord('1')
+        return payload
 
-        response = self.send_packet(0x65, payload)
-
-        payload = self.decrypt(response[0x38:])
+    def _auth_response(self, response):
+        payload = self.decrypt(memoryview(response)[BROADLINK_HEADER_LEN:])
 
         if not payload:
             return False
@@ -112,74 +273,271 @@ class broadlink_device:
             return False
 
         self.id = payload[0x00:0x04]
+        self.frame.set_id(self.id)
         self.update_aes(key)
+        self.session_generation += 1
 
         return True
 
-    def send_packet(self, command, payload):
+    def auth(self):
+        return self._auth_response(self.send_packet(0x65, self._auth_payload()))
+
+    async def async_auth(self):
+        return self._auth_response(await self.async_send_packet(0x65, self._auth_payload()))
+
+    # Renegotiate the session on the event loop
+    # generation is the session_generation the rejected request was sent with.
+    # Concurrent callers share a single handshake, a request rejected under a session
+    # that was replaced since is retried with the new one, and failed handshakes back
+    # off exponentially. Returns whether a valid session is available, without raising.
+    async def async_reauth(self, generation=None):
+        if self.auth_task is None:
+            if generation is not None and generation < self.session_generation:
+                self.auths_avoided += 1
+                return self.auth_result
+            if not self.auth_result and asyncio.get_running_loop().time() < self.auth_retry_time:
+                self.auths_avoided += 1
+                return False
+            self.auth_task = asyncio.ensure_future(self._async_reauth())
+        else:
+            self.auths_avoided += 1
+        return await asyncio.shield(self.auth_task)
+
+    async def _async_reauth(self):
+        loop = asyncio.get_running_loop()
+        self.auths_sent += 1
+        try:
+            authenticated = await self.async_auth()
+        except (OSError, ValueError) as exc:
+            _LOGGER.debug("[%s] authentication failed: %s", self.host, exc)
+            authenticated = False
+        finally:
+            self.auth_task = None
+        if authenticated:
+            self.auth_backoff = BROADLINK_AUTH_BACKOFF_MIN
+            self.auth_retry_time = 0
+            if self.on_session is not None:
+                self.on_session()
+        else:
+            self.auth_retry_time = loop.time() + self.auth_backoff
+            self.auth_backoff = min(self.auth_backoff * 2, BROADLINK_AUTH_BACKOFF_MAX)
+        self.auth_result = authenticated
+        return authenticated
+
+    def _build_packet(self, command, payload):
+        # a handshake always starts over from the default session, even when renegotiating
+        if command == 0x65 and self.key != BROADLINK_DEFAULT_KEY:
+            self.id = bytearray(BROADLINK_DEFAULT_ID)
+            self.frame.set_id(self.id)
+            self.update_aes(BROADLINK_DEFAULT_KEY)
+            self.session_generation += 1
         self.count = (self.count + 1) & 0xffff
-        packet = bytearray(0x38)
-        packet[0x00] = 0x5a
-        packet[0x01] = 0xa5
-        packet[0x02] = 0xaa
-        packet[0x03] = 0x55
-        packet[0x04] = 0x5a
-        packet[0x05] = 0xa5
-        packet[0x06] = 0xaa
-        packet[0x07] = 0x55
-        packet[0x24] = 0x2a
-        packet[0x25] = 0x27
-        packet[0x26] = command
-        packet[0x28] = self.count & 0xff
-        packet[0x29] = self.count >> 8
-        packet[0x2a] = self.mac[0]
-        packet[0x2b] = self.mac[1]
-        packet[0x2c] = self.mac[2]
-        packet[0x2d] = self.mac[3]
-        packet[0x2e] = self.mac[4]
-        packet[0x2f] = self.mac[5]
-        packet[0x30] = self.id[0]
-        packet[0x31] = self.id[1]
-        packet[0x32] = self.id[2]
-        packet[0x33] = self.id[3]
-
-        # pad the payload for AES encryption
-        if payload:
-            numpad = (len(payload) // 16 + 1) * 16
-            payload = payload.ljust(numpad, b"\x00")
-
-        checksum = 0xbeaf
-        for i in range(len(payload)):
-            checksum += payload[i]
-            checksum = checksum & 0xffff
-
-        payload = self.encrypt(payload)
-
-        packet[0x34] = checksum & 0xff
-        packet[0x35] = checksum >> 8
-
-        for i in range(len(payload)):
-            packet.append(payload[i])
-
-        checksum = 0xbeaf
-        for i in range(len(packet)):
-            checksum += packet[i]
-            checksum = checksum & 0xffff
-        packet[0x20] = checksum & 0xff
-        packet[0x21] = checksum >> 8
+        payload = broadlink_pad(payload)
+        return self.frame.build(
+            command, self.count, broadlink_checksum(payload), self.encrypt(payload))
+
+    # Throw away datagrams queued on the socket since the last exchange (late replies)
+    def _drain_socket(self):
+        self.cs.setblocking(False)
+        try:
+            while True:
+                self.cs.recv_into(self.buffer)
+                self.stale_datagrams += 1
+        except (BlockingIOError, InterruptedError):
+            pass
 
+    def send_packet(self, command, payload):
         start_time = time.time()
         with self.lock:
+            packet = self._build_packet(command, payload)
+            count = self.count
+            if self.cs is None:
+                self.cs = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.cs.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.cs.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                self.cs.bind(('', 0))
+            self._drain_socket()
+            retransmitted = False
             while True:
                 try:
+                    send_time = time.monotonic()
                     self.cs.sendto(packet, self.host)
-                    self.cs.settimeout(1)
-                    response = self.cs.recvfrom(2048)
+                    self.cs.settimeout(self.rtt.rto)
+                    # only the reply echoing our count is ours, anything else is stale
+                    while True:
+                        nbytes = self.cs.recv_into(self.buffer)
+                        if nbytes >= BROADLINK_HEADER_LEN and \
+                           broadlink_reply_count(self.buffer) == count:
+                            break
+                        self.stale_datagrams += 1
+                    if not retransmitted:
+                        self.rtt.sample(time.monotonic() - send_time)
                     break
                 except socket.timeout:
                     if (time.time() - start_time) > self.timeout:
                         raise
-        return bytearray(response[0])
+                    retransmitted = True
+                    self.rtt.backoff()
+            # the buffer is reused by the next exchange
+            return bytes(memoryview(self.buffer)[:nbytes])
+
+    async def _async_resolve(self):
+        if self.addr is None:
+            loop = asyncio.get_running_loop()
+            infos = await loop.getaddrinfo(
+                self.host[0], self.host[1], family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            self.addr = infos[0][4]
+        return self.addr
+
+    # Wait for the reply to an idempotent request, sending a second copy with its own
+    # count if none arrived within the p90 latency. Returns the reply and the send time
+    # of the copy that produced it.
+    async def _async_wait_hedged(self, future, send_time, command, payload, addr):
+        loop = asyncio.get_running_loop()
+        delay = self.rtt.percentile(0.9)
+        if delay is None or delay >= self.rtt.rto:
+            return await asyncio.wait_for(future, self.rtt.rto), send_time
+        done, _pending = await asyncio.wait([future], timeout=delay)
+        if done:
+            return future.result(), send_time
+        hedge_packet = self._build_packet(command, payload)
+        hedge_count = self.count
+        hedge = self.protocol.expect(addr, self.mac, hedge_count)
+        hedge_time = loop.time()
+        self.protocol.transport.sendto(hedge_packet, addr)
+        self.hedges_sent += 1
+        try:
+            done, _pending = await asyncio.wait(
+                [future, hedge],
+                timeout=self.rtt.rto - delay,
+                return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.protocol.forget(addr, hedge_count)
+        if future in done:
+            return future.result(), send_time
+        if hedge in done:
+            self.hedges_won += 1
+            return hedge.result(), hedge_time
+        future.cancel()
+        raise asyncio.TimeoutError
+
+    # Same exchange as send_packet but on the event loop, no thread is blocked while waiting
+    # Raises socket.timeout like send_packet so callers handle both paths the same way
+    async def async_send_packet(self, command, payload, hedge=False):
+        response, _generation = await self._async_exchange(command, payload, hedge)
+        return response
+
+    # Returns the reply and the session generation the request was encrypted with
+    async def _async_exchange(self, command, payload, hedge=False):
+        # requests queued behind a handshake are sent with the new session
+        if command != 0x65 and self.auth_task is not None:
+            await asyncio.shield(self.auth_task)
+        if self.async_lock is None:
+            self.async_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        async with self.async_lock:
+            packet = self._build_packet(command, payload)
+            count = self.count
+            generation = self.session_generation
+            addr = await self._async_resolve()
+            await self.protocol.async_open()
+            retransmitted = False
+            try:
+                while True:
+                    future = self.protocol.expect(addr, self.mac, count)
+                    send_time = loop.time()
+                    self.protocol.transport.sendto(packet, addr)
+                    try:
+                        if hedge and not retransmitted:
+                            response, send_time = await self._async_wait_hedged(
+                                future, send_time, command, payload, addr)
+                        else:
+                            response = await asyncio.wait_for(future, self.rtt.rto)
+                        if not retransmitted:
+                            self.rtt.sample(loop.time() - send_time)
+                        break
+                    except asyncio.TimeoutError:
+                        if (loop.time() - start_time) > self.timeout:
+                            raise socket.timeout('timed out')
+                        retransmitted = True
+                        self.rtt.backoff()
+            finally:
+                self.protocol.forget(addr, count)
+        return response, generation
+
+    # Release the sockets, exchanges in flight fail instead of waiting for their timeout
+    def close(self):
+        if not self.shared_protocol:
+            self.protocol.close()
+        elif self.addr is not None:
+            self.protocol.abort(self.addr, ConnectionAbortedError('device closed'))
+        if self.cs is not None:
+            self.cs.close()
+            self.cs = None
+
+    def _request_payload(self, input_payload):
+        crc = crc16_modbus(input_payload)
+
+        # first byte is length, +2 for CRC16
+        request_payload = bytearray([len(input_payload) + 2,0x00])
+        request_payload.extend(input_payload)
+
+        # append CRC
+        request_payload.append(crc & 0xFF)
+        request_payload.append((crc >> 8) & 0xFF)
+        return request_payload
+
+    def _response_payload(self, response):
+        # check for error
+        err = response[0x22] | (response[0x23] << 8)
+        if err:
+            raise ValueError('broadlink_response_error',err)
+      
+        response_payload = bytearray(self.decrypt(memoryview(response)[BROADLINK_HEADER_LEN:]))
+        
+        # experimental check on CRC in response (first 2 bytes are len, and trailing bytes are crc)
+        response_payload_len = response_payload[0]
+        if response_payload_len + 2 > len(response_payload):
+            raise ValueError('hysen_response_error','first byte of response is not length')
+        crc = crc16_modbus(memoryview(response_payload)[2:response_payload_len])
+        if (response_payload[response_payload_len] == crc & 0xFF) and \
+           (response_payload[response_payload_len+1] == (crc >> 8) & 0xFF):
+            return response_payload[2:response_payload_len]
+        else:
+            raise ValueError('hysen_response_error','CRC check on response failed')
+
+    # check if return response is right
+    def _response_matches(self, input_payload, return_payload):
+        if (input_payload[0:2] == bytearray([0x01, 0x06])) and \
+           (input_payload != return_payload):
+            pass
+        elif (input_payload[0:2] == bytearray([0x01, 0x10])) and \
+             (input_payload[0:6] != return_payload):
+            pass
+        elif (input_payload[0:2] == bytearray([0x01, 0x03])) and \
+             ((input_payload[0:2] != return_payload[0:2]) or \
+             ((2 * input_payload[5]) != return_payload[2]) or \
+             ((2 * input_payload[5]) != len(return_payload[3:]))):
+            pass
+        else:
+            return True
+        _LOGGER.error("[%s] request %s response %s",
+            self.host,
+            ' '.join(format(x, '02x') for x in bytearray(input_payload)),
+            ' '.join(format(x, '02x') for x in bytearray(return_payload)))
+        return False
+
+    # Returns the request's answer, or None when the device rejected the session
+    # (authorization error or an answer that does not belong to the request)
+    def _session_response(self, input_payload, response):
+        if (response[0x22] | (response[0x23] << 8)) == BROADLINK_ERROR_AUTHORIZATION:
+            _LOGGER.debug("[%s] session key rejected", self.host)
+            return None
+        return_payload = self._response_payload(response)
+        if not self._response_matches(input_payload, return_payload):
+            return None
+        return return_payload
 
     # Send a request
     # Returns decrypted payload
@@ -280,72 +638,29 @@ class broadlink_device:
     #        0x03 - Wrong length
     # New behavior: raises a ValueError if the device response indicates an error or CRC check fails
     # The function prepends length (2 bytes) and appends CRC
+    # async_send_request is the same request sent from the event loop
     def send_request(self, input_payload):
-        for i in range(1, 3):
-            crc = CRC16(modbus_flag = True).calculate(bytes(input_payload))
-            if crc == None:
-                _LOGGER.error("[%s] CRC16 returned None, step %s.", self._host, i)
-            else:
-                break
-                
-        # first byte is length, +2 for CRC16
-        request_payload = bytearray([len(input_payload) + 2,0x00])
-        request_payload.extend(input_payload)
-
-        # append CRC
-        request_payload.append(crc & 0xFF)
-        request_payload.append((crc >> 8) & 0xFF)
-
-        # send to device
-        response = self.send_packet(0x6a, request_payload)
-
-        # check for error
-        err = response[0x22] | (response[0x23] << 8)
-        if err:
-            raise ValueError('broadlink_response_error',err)
-      
-        response_payload = bytearray(self.decrypt(bytes(response[0x38:])))
-        
-        # experimental check on CRC in response (first 2 bytes are len, and trailing bytes are crc)
-        response_payload_len = response_payload[0]
-        if response_payload_len + 2 > len(response_payload):
-            raise ValueError('hysen_response_error','first byte of response is not length')
-        crc = CRC16(modbus_flag=True).calculate(bytes(response_payload[2:response_payload_len]))
-        if (response_payload[response_payload_len] == crc & 0xFF) and \
-           (response_payload[response_payload_len+1] == (crc >> 8) & 0xFF):
-            return_payload = response_payload[2:response_payload_len]
-        else:
-            raise ValueError('hysen_response_error','CRC check on response failed')
-            
-        # check if return response is right
-        if (input_payload[0:2] == bytearray([0x01, 0x06])) and \
-           (input_payload != return_payload):
-            _LOGGER.error("[%s] request %s response %s",
-                self.host,
-                ' '.join(format(x, '02x') for x in bytearray(input_payload)),
-                ' '.join(format(x, '02x') for x in bytearray(return_payload)))
-            self.auth()
-            raise ValueError('hysen_response_error','response is wrong')
-        elif (input_payload[0:2] == bytearray([0x01, 0x10])) and \
-             (input_payload[0:6] != return_payload):
-            _LOGGER.error("[%s] request %s response %s",
-                self.host,
-                ' '.join(format(x, '02x') for x in bytearray(input_payload)),
-                ' '.join(format(x, '02x') for x in bytearray(return_payload)))
-            self.auth()
-            raise ValueError('hysen_response_error','response is wrong')
-        elif (input_payload[0:2] == bytearray([0x01, 0x03])) and \
-             ((input_payload[0:2] != return_payload[0:2]) or \
-             ((2 * input_payload[5]) != return_payload[2]) or \
-             ((2 * input_payload[5]) != len(return_payload[3:]))):
-            _LOGGER.error("[%s] request %s response %s",
-                self.host,
-                ' '.join(format(x, '02x') for x in bytearray(input_payload)),
-                ' '.join(format(x, '02x') for x in bytearray(return_payload)))
+        response = self.send_packet(0x6a, self._request_payload(input_payload))
+        return_payload = self._session_response(input_payload, response)
+        if return_payload is None:
             self.auth()
             raise ValueError('hysen_response_error','response is wrong')
-        else:
-            return return_payload
+        return return_payload
+
+    # A rejected request waits for the shared re-authentication and is sent once more
+    async def async_send_request(self, input_payload):
+        # only reads are safe to duplicate, writes are never hedged
+        hedge = self.hedge_reads and input_payload[1] == 0x03
+        request_payload = self._request_payload(input_payload)
+        response, generation = await self._async_exchange(0x6a, request_payload, hedge)
+        return_payload = self._session_response(input_payload, response)
+        if return_payload is None:
+            if await self.async_reauth(generation):
+                response = await self.async_send_packet(0x6a, request_payload, hedge)
+                return_payload = self._session_response(input_payload, response)
+            if return_payload is None:
+                raise ValueError('hysen_response_error','response is wrong')
+        return return_payload
 
 """
 Hysen Controller for 2 Pipe Fan Coil Interface
@@ -353,6 +668,9 @@ Hysen HY03AC-x-Wifi device and derivative
 http://www.xmhysen.com/products_detail/productId=201.html
 """
 
+# Device type reported by the HY03AC in discovery replies
+HYSEN_2PFC_DEV_TYPE             = 0x4F5B
+
 HYSEN_2PFC_REMOTE_LOCK_OFF      = 0
 HYSEN_2PFC_REMOTE_LOCK_ON       = 1
 
@@ -406,48 +724,315 @@ HYSEN_2PFC_MIN_TEMP             = 10
 HYSEN_2PFC_DEFAULT_TARGET_TEMP  = 22
 HYSEN_2PFC_DEFAULT_CALIBRATION  = 0.0
 
+# Register file of 16 words mirrored locally
+HYSEN_2PFC_REGISTER_WORDS       = 16
+# Age in seconds up to which a mirrored word is trusted instead of read again before a write
+HYSEN_2PFC_REGISTER_MAX_AGE     = 30.0
+# Bits the device maintains itself, a write echo does not tell their value:
+# valve state, room temperature and the valve on counter
+HYSEN_2PFC_REGISTER_READ_ONLY   = bytes(
+    [0x00, 0x10, 0x00, 0x00, 0xFF, 0x00, 0x00, 0x00,
+     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+     0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+     0x00, 0x00, 0x00, 0x00, 0xFF, 0xFF, 0xFF, 0xFF])
+
+# Status register map, see get_device_status for the meaning of each byte
+# The 32 bytes register block is unpacked in one call, one value per byte
+# except the valve on counter (4 bytes, big endian) which comes last
+# name, index of the unpacked value, right shift, mask (None keeps the unpacked value)
+HYSEN_2PFC_STATUS_STRUCT = struct.Struct('>7Bb20BI')
+HYSEN_2PFC_STATUS_MAP = (
+    ('remote_lock',          0, 4, 0x01),
+    ('key_lock',             0, 0, 0x03),
+    ('valve_state',          1, 4, 0x01),
+    ('power_state',          1, 0, 0x01),
+    ('operation_mode',       2, 0, None),
+    ('fan_mode',             3, 0, None),
+    ('room_temp',            4, 0, None),
+    ('target_temp',          5, 0, None),
+    ('hysteresis',           6, 0, None),
+    ('calibration',          7, 0, None),
+    ('cooling_max_temp',     8, 0, None),
+    ('cooling_min_temp',     9, 0, None),
+    ('heating_max_temp',    10, 0, None),
+    ('heating_min_temp',    11, 0, None),
+    ('fan_control',         12, 0, None),
+    ('frost_protection',    13, 0, None),
+    ('clock_hour',          14, 0, None),
+    ('clock_min',           15, 0, None),
+    ('clock_sec',           16, 0, None),
+    ('clock_weekday',       17, 0, None),
+    ('unknown',             18, 0, None),
+    ('schedule',            19, 0, None),
+    ('period1_on_enabled',  20, 7, 0x01),
+    ('period1_on_hour',     20, 0, 0x1F),
+    ('period1_on_min',      21, 0, 0x3F),
+    ('period1_off_enabled', 22, 7, 0x01),
+    ('period1_off_hour',    22, 0, 0x1F),
+    ('period1_off_min',     23, 0, 0x3F),
+    ('period2_on_enabled',  24, 7, 0x01),
+    ('period2_on_hour',     24, 0, 0x1F),
+    ('period2_on_min',      25, 0, 0x3F),
+    ('period2_off_enabled', 26, 7, 0x01),
+    ('period2_off_hour',    26, 0, 0x1F),
+    ('period2_off_min',     27, 0, 0x3F),
+    ('time_valve_on',       28, 0, None),
+)
+# fields the device keeps in tenths
+HYSEN_2PFC_STATUS_SCALE = {'calibration': 10.0}
+# byte index, right shift and mask of each field, by name
+HYSEN_2PFC_STATUS_FIELDS = dict((field[0], field[1:]) for field in HYSEN_2PFC_STATUS_MAP)
+
+# Decodes the values unpacked by HYSEN_2PFC_STATUS_STRUCT in the order of
+# HYSEN_2PFC_STATUS_MAP, written out as a single expression as it is on the hot path
+def _decode_status(raw):
+    return (
+        (raw[0] >> 4) & 0x01,   # remote_lock
+        raw[0] & 0x03,          # key_lock
+        (raw[1] >> 4) & 0x01,   # valve_state
+        raw[1] & 0x01,          # power_state
+        raw[2],                 # operation_mode
+        raw[3],                 # fan_mode
+        raw[4],                 # room_temp
+        raw[5],                 # target_temp
+        raw[6],                 # hysteresis
+        raw[7] / 10.0,          # calibration
+        raw[8],                 # cooling_max_temp
+        raw[9],                 # cooling_min_temp
+        raw[10],                # heating_max_temp
+        raw[11],                # heating_min_temp
+        raw[12],                # fan_control
+        raw[13],                # frost_protection
+        raw[14],                # clock_hour
+        raw[15],                # clock_min
+        raw[16],                # clock_sec
+        raw[17],                # clock_weekday
+        raw[18],                # unknown
+        raw[19],                # schedule
+        (raw[20] >> 7) & 0x01,  # period1_on_enabled
+        raw[20] & 0x1F,         # period1_on_hour
+        raw[21] & 0x3F,         # period1_on_min
+        (raw[22] >> 7) & 0x01,  # period1_off_enabled
+        raw[22] & 0x1F,         # period1_off_hour
+        raw[23] & 0x3F,         # period1_off_min
+        (raw[24] >> 7) & 0x01,  # period2_on_enabled
+        raw[24] & 0x1F,         # period2_on_hour
+        raw[25] & 0x3F,         # period2_on_min
+        (raw[26] >> 7) & 0x01,  # period2_off_enabled
+        raw[26] & 0x1F,         # period2_off_hour
+        raw[27] & 0x3F,         # period2_off_min
+        raw[28],                # time_valve_on
+    )
+
+class Hysen2PipeFanCoilStatus(
+        collections.namedtuple(
+            'Hysen2PipeFanCoilStatus',
+            [field[0] for field in HYSEN_2PFC_STATUS_MAP])):
+    """Immutable snapshot of the device status registers."""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_registers(cls, data, offset=0):
+        return tuple.__new__(cls, _decode_status(HYSEN_2PFC_STATUS_STRUCT.unpack_from(data, offset)))
+
+HYSEN_2PFC_DEFAULT_STATUS = Hysen2PipeFanCoilStatus(
+    remote_lock = HYSEN_2PFC_REMOTE_LOCK_OFF,
+    key_lock = HYSEN_2PFC_KEY_ALL_UNLOCKED,
+    valve_state = HYSEN_2PFC_VALVE_OFF,
+    power_state = HYSEN_2PFC_POWER_ON,
+    operation_mode = HYSEN_2PFC_MODE_FAN,
+    fan_mode = HYSEN_2PFC_FAN_LOW,
+    room_temp = 0,
+    target_temp = HYSEN_2PFC_DEFAULT_TARGET_TEMP,
+    hysteresis = HYSEN_2PFC_HYSTERESIS_WHOLE,
+    calibration = HYSEN_2PFC_DEFAULT_CALIBRATION,
+    cooling_max_temp = HYSEN_2PFC_MAX_TEMP,
+    cooling_min_temp = HYSEN_2PFC_MIN_TEMP,
+    heating_max_temp = HYSEN_2PFC_MAX_TEMP,
+    heating_min_temp = HYSEN_2PFC_MIN_TEMP,
+    fan_control = HYSEN_2PFC_FAN_CONTROL_ON,
+    frost_protection = HYSEN_2PFC_FROST_PROTECTION_ON,
+    clock_hour = 0,
+    clock_min = 0,
+    clock_sec = 0,
+    clock_weekday = 1,
+    unknown = 0,
+    schedule = HYSEN_2PFC_SCHEDULE_TODAY,
+    period1_on_enabled = HYSEN_2PFC_PERIOD_DISABLED,
+    period1_on_hour = 0,
+    period1_on_min = 0,
+    period1_off_enabled = HYSEN_2PFC_PERIOD_DISABLED,
+    period1_off_hour = 0,
+    period1_off_min = 0,
+    period2_on_enabled = HYSEN_2PFC_PERIOD_DISABLED,
+    period2_on_hour = 0,
+    period2_on_min = 0,
+    period2_off_enabled = HYSEN_2PFC_PERIOD_DISABLED,
+    period2_off_hour = 0,
+    period2_off_min = 0,
+    time_valve_on = 0)
+
+# Values the fields written by apply() may take
+HYSEN_2PFC_ADMITTED_VALUES = {
+    'remote_lock': (HYSEN_2PFC_REMOTE_LOCK_OFF, HYSEN_2PFC_REMOTE_LOCK_ON),
+    'key_lock': (HYSEN_2PFC_KEY_ALL_UNLOCKED, HYSEN_2PFC_KEY_POWER_UNLOCKED, HYSEN_2PFC_KEY_ALL_LOCKED),
+    'power_state': (HYSEN_2PFC_POWER_OFF, HYSEN_2PFC_POWER_ON),
+    'operation_mode': (HYSEN_2PFC_MODE_FAN, HYSEN_2PFC_MODE_COOL, HYSEN_2PFC_MODE_HEAT),
+    'fan_mode': (HYSEN_2PFC_FAN_LOW, HYSEN_2PFC_FAN_MEDIUM, HYSEN_2PFC_FAN_HIGH, HYSEN_2PFC_FAN_AUTO),
+    'hysteresis': (HYSEN_2PFC_HYSTERESIS_HALVE, HYSEN_2PFC_HYSTERESIS_WHOLE),
+    'fan_control': (HYSEN_2PFC_FAN_CONTROL_ON, HYSEN_2PFC_FAN_CONTROL_OFF),
+    'frost_protection': (HYSEN_2PFC_FROST_PROTECTION_OFF, HYSEN_2PFC_FROST_PROTECTION_ON),
+    'schedule': (HYSEN_2PFC_SCHEDULE_TODAY, HYSEN_2PFC_SCHEDULE_12345_67, HYSEN_2PFC_SCHEDULE_123456_7, HYSEN_2PFC_SCHEDULE_1234567),
+    'period1_on_enabled': (HYSEN_2PFC_PERIOD_DISABLED, HYSEN_2PFC_PERIOD_ENABLED),
+    'period1_off_enabled': (HYSEN_2PFC_PERIOD_DISABLED, HYSEN_2PFC_PERIOD_ENABLED),
+    'period2_on_enabled': (HYSEN_2PFC_PERIOD_DISABLED, HYSEN_2PFC_PERIOD_ENABLED),
+    'period2_off_enabled': (HYSEN_2PFC_PERIOD_DISABLED, HYSEN_2PFC_PERIOD_ENABLED),
+}
+# Inclusive ranges of the numeric ones
+HYSEN_2PFC_ADMITTED_RANGES = {
+    'target_temp': (HYSEN_2PFC_MIN_TEMP, HYSEN_2PFC_MAX_TEMP),
+    'calibration': (HYSEN_2PFC_CALIBRATION_MIN, HYSEN_2PFC_CALIBRATION_MAX),
+    'cooling_max_temp': (HYSEN_2PFC_COOLING_MIN_TEMP, HYSEN_2PFC_COOLING_MAX_TEMP),
+    'cooling_min_temp': (HYSEN_2PFC_COOLING_MIN_TEMP, HYSEN_2PFC_COOLING_MAX_TEMP),
+    'heating_max_temp': (HYSEN_2PFC_HEATING_MIN_TEMP, HYSEN_2PFC_HEATING_MAX_TEMP),
+    'heating_min_temp': (HYSEN_2PFC_HEATING_MIN_TEMP, HYSEN_2PFC_HEATING_MAX_TEMP),
+    'clock_hour': (0, 23),
+    'clock_min': (0, 59),
+    'clock_sec': (0, 59),
+    'clock_weekday': (1, 7),
+    'period1_on_hour': (0, 23),
+    'period1_on_min': (0, 59),
+    'period1_off_hour': (0, 23),
+    'period1_off_min': (0, 59),
+    'period2_on_hour': (0, 23),
+    'period2_on_min': (0, 59),
+    'period2_off_hour': (0, 23),
+    'period2_off_min': (0, 59),
+}
+# Fields the device maintains itself
+HYSEN_2PFC_READ_ONLY_FIELDS = ('valve_state', 'room_temp', 'unknown', 'time_valve_on')
+# Words apply() rewrites only when they change, never to merge two writes: the running clock
+HYSEN_2PFC_VOLATILE_WORDS = (7, 8)
+# Unchanged words a merged write may span rather than sending two packets
+HYSEN_2PFC_WRITE_MAX_GAP = 2
+# Seconds a word written by apply_later() has to stay unchanged before it is sent
+HYSEN_2PFC_DEBOUNCE_DELAY = 0.5
+# Words a poll reads every time: lock/power/valve, mode/fan, room/target temperature
+HYSEN_2PFC_HOT_WORDS = (0, 2)
+# Total time valve on, it only moves while the valve is open
+HYSEN_2PFC_VALVE_COUNTER_WORDS = (14, 15)
+# Seconds the other words are trusted by a poll before the whole file is read again
+HYSEN_2PFC_COLD_MAX_AGE = 300.0
+# Offsets the drift of a clock is fitted on
+HYSEN_2PFC_CLOCK_SAMPLES = 16
+# Seconds the device clock may be predicted off before it is set again
+HYSEN_2PFC_CLOCK_MAX_ERROR = 30.0
+HYSEN_2PFC_WEEK_SECONDS = 7 * 24 * 3600
+# Weekdays (1 = Monday) the periods of the status words are known to run on
+# The weekly schedule modes are named after their day groups (Lm in word 9, see
+# _weekly_schedule_request): 12345_67 runs one programme from Monday to Friday and
+# another on the weekend, 123456_7 one from Monday to Saturday and another on Sunday.
+# The status words hold a single set of periods, taken as the programme of the first
+# group. Where the other days keep theirs is not decoded, no switch is predicted on
+# those days and the device is polled at its normal interval there
+HYSEN_2PFC_SCHEDULE_DAYS = {
+    HYSEN_2PFC_SCHEDULE_TODAY: (1, 2, 3, 4, 5, 6, 7),
+    HYSEN_2PFC_SCHEDULE_12345_67: (1, 2, 3, 4, 5),
+    HYSEN_2PFC_SCHEDULE_123456_7: (1, 2, 3, 4, 5, 6),
+    HYSEN_2PFC_SCHEDULE_1234567: (1, 2, 3, 4, 5, 6, 7),
+}
+# Enabled, hour and minute fields of each programmed switch
+HYSEN_2PFC_PERIOD_EDGES = tuple(
+    tuple('period%d_%s_%s' % (period, edge, part) for part in ('enabled', 'hour', 'min'))
+    for period in (1, 2) for edge in ('on', 'off'))
+
+
+class Hysen2PipeFanCoilClock:
+    """Offset and drift of a device clock from the local time.
+
+    Offsets are taken each time the clock words are read, a least squares line
+    over the last ones predicts the offset at any later time. An offset far from
+    the prediction (clock set on the panel, DST) starts the fit over.
+    """
+
+    def __init__(self):
+        self.samples = collections.deque(maxlen=HYSEN_2PFC_CLOCK_SAMPLES)
+        # seconds gained per second, kept over a reset
+        self.drift = 0.0
+
+    # offset in seconds of device_seconds from local_seconds, both seconds of the week,
+    # taken at monotonic time t
+    def sample(self, t, local_seconds, device_seconds):
+        offset = (device_seconds - local_seconds + HYSEN_2PFC_WEEK_SECONDS / 2) \
+            % HYSEN_2PFC_WEEK_SECONDS - HYSEN_2PFC_WEEK_SECONDS / 2
+        expected = self.predict(t)
+        if expected is not None and abs(offset - expected) > HYSEN_2PFC_CLOCK_MAX_ERROR:
+            self.samples.clear()
+        self.samples.append((t, offset))
+        if len(self.samples) > 1:
+            t_mean = sum(x for x, _y in self.samples) / len(self.samples)
+            y_mean = sum(y for _x, y in self.samples) / len(self.samples)
+            spread = sum((x - t_mean) ** 2 for x, _y in self.samples)
+            if spread > 0:
+                self.drift = sum(
+                    (x - t_mean) * (y - y_mean) for x, y in self.samples) / spread
+
+    # offset expected at monotonic time t, None before the first sample
+    def predict(self, t):
+        if not self.samples:
+            return None
+        t_mean = sum(x for x, _y in self.samples) / len(self.samples)
+        y_mean = sum(y for _x, y in self.samples) / len(self.samples)
+        return y_mean + self.drift * (t - t_mean)
+
+    # the clock was set, earlier offsets are void
+    def reset(self):
+        self.samples.clear()
+
+
 class Hysen2PipeFanCoilDevice(broadlink_device):
     
-    def __init__ (self, host, mac, devtype, timeout):
-        broadlink_device.__init__(self, host, mac, devtype, timeout)
+    def __init__ (self, host, mac, devtype, timeout, protocol=None, hedge_reads=False):
+        broadlink_device.__init__(self, host, mac, devtype, timeout, protocol, hedge_reads)
         self.type = "Hysen 2 Pipe Fan Coil Controller"
         self._host = host[0]
         
-        self.remote_lock = HYSEN_2PFC_REMOTE_LOCK_OFF
-        self.key_lock = HYSEN_2PFC_KEY_ALL_UNLOCKED
-        self.valve_state = HYSEN_2PFC_VALVE_OFF
-        self.power_state = HYSEN_2PFC_POWER_ON
-        self.operation_mode = HYSEN_2PFC_MODE_FAN
-        self.fan_mode = HYSEN_2PFC_FAN_LOW
-        self.room_temp = 0        
-        self.target_temp = HYSEN_2PFC_DEFAULT_TARGET_TEMP
-        self.hysteresis = HYSEN_2PFC_HYSTERESIS_WHOLE
-        self.calibration = HYSEN_2PFC_DEFAULT_CALIBRATION
-        self.cooling_max_temp = HYSEN_2PFC_MAX_TEMP
-        self.cooling_min_temp = HYSEN_2PFC_MIN_TEMP
-        self.heating_max_temp = HYSEN_2PFC_MAX_TEMP
-        self.heating_min_temp = HYSEN_2PFC_MIN_TEMP
-        self.fan_control = HYSEN_2PFC_FAN_CONTROL_ON
-        self.frost_protection = HYSEN_2PFC_FROST_PROTECTION_ON
-        self.clock_hour = 0
-        self.clock_min = 0
-        self.clock_sec = 0
-        self.clock_weekday = 1
-        self.unknown = 0
-        self.schedule = HYSEN_2PFC_SCHEDULE_TODAY
-        self.period1_on_enabled = HYSEN_2PFC_PERIOD_DISABLED
-        self.period1_on_hour = 0
-        self.period1_on_min = 0
-        self.period1_off_enabled = HYSEN_2PFC_PERIOD_DISABLED
-        self.period1_off_hour = 0
-        self.period1_off_min = 0
-        self.period2_on_enabled = HYSEN_2PFC_PERIOD_DISABLED
-        self.period2_on_hour = 0
-        self.period2_on_min = 0
-        self.period2_off_enabled = HYSEN_2PFC_PERIOD_DISABLED
-        self.period2_off_hour = 0
-        self.period2_off_min = 0
-        self.time_valve_on = 0
+        # last decoded status, fields are also readable on the device itself
+        self.status = HYSEN_2PFC_DEFAULT_STATUS
+        # mirror of the device registers, with the time each word was last confirmed
+        self.registers = bytearray(2 * HYSEN_2PFC_REGISTER_WORDS)
+        self.registers_time = [None] * HYSEN_2PFC_REGISTER_WORDS
+        self.register_max_age = HYSEN_2PFC_REGISTER_MAX_AGE
+        # values of apply_later() not written yet, read back in place of the status
+        self.pending = {}
+        self.pending_waiters = []
+        self.pending_deadlines = {}
+        self.pending_timers = {}
+        self.debounce_delay = HYSEN_2PFC_DEBOUNCE_DELAY
+        # words written since they were last read back
+        self.registers_written = set()
+        self.cold_max_age = HYSEN_2PFC_COLD_MAX_AGE
+        self.valve_counter_moving = False
+        # bumped whenever a word other than the clock changed, the status is only
+        # decoded again when the frame did
+        self.registers_version = 0
+        # bumped whenever a control or status word changed, the valve counter aside
+        self.control_version = 0
+        self.registers_decoded = False
+        self.clock = Hysen2PipeFanCoilClock()
+        # monotonic time the device read its clock words last, half a round trip
+        # before the answer arrived
+        self.clock_read_time = None
+        self.clock_sample_time = None
+        # called after every confirmed write, e.g. to poll the device sooner
+        self.on_write = None
+
+    # Find the controllers on the LAN with a single broadcast
+    # Returns broadlink_discovered tuples (host, mac, devtype, name) of HY03AC devices only
+    @staticmethod
+    async def async_discover(timeout=BROADLINK_DISCOVERY_TIMEOUT, **kwargs):
+        return await broadlink_discover(timeout, (HYSEN_2PFC_DEV_TYPE,), **kwargs)
 
     # set lock and power
     # 0x01, 0x06, 0x00, 0x00, 0xrk, 0x0p
@@ -455,13 +1040,19 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
     # k = Key lock (Loc), 0 = Unlocked, 1 = All buttons locked except Power, 2 = All buttons locked
     # p = Power State, 0 = Power off, 1 = Power on
     # If remote lock is Off then key lock has to be unlocked otherwise after any subsequent command we will get remote lock on
-    def set_lock_power(self, remote_lock, key_lock, power_state):
+    def _lock_power_request(self, remote_lock, key_lock, power_state):
         _request = bytearray([0x01, 0x06, 0x00, 0x00])
         _request.append((remote_lock << 4) + key_lock)
         _request.append(power_state)
-        self.send_request(_request)
+        return _request
 
-    def set_remote_lock(self, key_lock):
+    def set_lock_power(self, remote_lock, key_lock, power_state):
+        self.send_request(self._lock_power_request(remote_lock, key_lock, power_state))
+
+    async def async_set_lock_power(self, remote_lock, key_lock, power_state):
+        await self.async_send_request(self._lock_power_request(remote_lock, key_lock, power_state))
+
+    def _remote_lock_request(self, key_lock):
         if key_lock not in [
             HYSEN_2PFC_KEY_ALL_UNLOCKED,
             HYSEN_2PFC_KEY_POWER_UNLOCKED,
@@ -472,17 +1063,24 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 HYSEN_2PFC_KEY_ALL_UNLOCKED,
                 HYSEN_2PFC_KEY_POWER_UNLOCKED,
                 HYSEN_2PFC_KEY_ALL_LOCKED))
-        self.get_device_status()
         if key_lock == HYSEN_2PFC_KEY_ALL_UNLOCKED:
-            self.remote_lock = HYSEN_2PFC_REMOTE_LOCK_OFF;
+            remote_lock = HYSEN_2PFC_REMOTE_LOCK_OFF
         else:
-            self.remote_lock = HYSEN_2PFC_REMOTE_LOCK_ON;
-        self.set_lock_power(
-            self.remote_lock,
+            remote_lock = HYSEN_2PFC_REMOTE_LOCK_ON
+        return self._lock_power_request(
+            remote_lock,
             key_lock,
             self.power_state)
 
-    def set_power(self, power):
+    def set_remote_lock(self, key_lock):
+        self.refresh_registers(0, 0)
+        self.send_request(self._remote_lock_request(key_lock))
+
+    async def async_set_remote_lock(self, key_lock):
+        await self.async_refresh_registers(0, 0)
+        await self.async_send_request(self._remote_lock_request(key_lock))
+
+    def _power_request(self, power):
         if power not in [
             HYSEN_2PFC_POWER_OFF,
             HYSEN_2PFC_POWER_ON]:
@@ -491,25 +1089,38 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 power,
                 HYSEN_2PFC_POWER_OFF,
                 HYSEN_2PFC_POWER_ON))
-        self.get_device_status()
-        self.set_lock_power(
+        return self._lock_power_request(
             self.remote_lock,
             self.key_lock,
             power)
 
+    def set_power(self, power):
+        self.refresh_registers(0, 0)
+        self.send_request(self._power_request(power))
+
+    async def async_set_power(self, power):
+        await self.async_refresh_registers(0, 0)
+        await self.async_send_request(self._power_request(power))
+
     # set mode and fan
     # 0x01, 0x06, 0x00, 0x01, Mod, Fs
     # Mod = Operation mode, 0x01 = Ventilation, 0x02 = Cooling, 0x03 = Heating
     # Fs = Fan speed, 0x01 = Low, 0x02 = Medium, 0x03 = High, 0x04 = Auto
     # Note: Ventilation and fan auto are mutual exclusive (e.g. Mod = 0x01 and Fs = 0x04 is not allowed)
     #       The calling method should deal with that 
-    def set_mode_fan(self, operation_mode, fan_mode):
+    def _mode_fan_request(self, operation_mode, fan_mode):
         _request = bytearray([0x01, 0x06, 0x00, 0x01])
         _request.append(operation_mode)
         _request.append(fan_mode)
-        self.send_request(_request)
+        return _request
 
-    def set_fan_mode(self, fan_mode):
+    def set_mode_fan(self, operation_mode, fan_mode):
+        self.send_request(self._mode_fan_request(operation_mode, fan_mode))
+
+    async def async_set_mode_fan(self, operation_mode, fan_mode):
+        await self.async_send_request(self._mode_fan_request(operation_mode, fan_mode))
+
+    def _fan_mode_request(self, fan_mode):
         if fan_mode not in [
             HYSEN_2PFC_FAN_LOW,
             HYSEN_2PFC_FAN_MEDIUM,
@@ -522,16 +1133,23 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 HYSEN_2PFC_FAN_MEDIUM,
                 HYSEN_2PFC_FAN_HIGH,
                 HYSEN_2PFC_FAN_AUTO))
-        self.get_device_status()
         if (fan_mode == HYSEN_2PFC_FAN_AUTO) and \
            (self.operation_mode == HYSEN_2PFC_MODE_FAN):
             raise ValueError(
                 'Can\'t have fan_mode \'auto\' and operation_mode \'fan_only\'.')
-        self.set_mode_fan(
+        return self._mode_fan_request(
             self.operation_mode,
             fan_mode)
+
+    def set_fan_mode(self, fan_mode):
+        self.refresh_registers(1, 1)
+        self.send_request(self._fan_mode_request(fan_mode))
+
+    async def async_set_fan_mode(self, fan_mode):
+        await self.async_refresh_registers(1, 1)
+        await self.async_send_request(self._fan_mode_request(fan_mode))
     
-    def set_operation_mode(self, operation_mode):
+    def _operation_mode_request(self, operation_mode):
         if operation_mode not in [
             HYSEN_2PFC_MODE_FAN,
             HYSEN_2PFC_MODE_COOL,
@@ -542,14 +1160,21 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 HYSEN_2PFC_MODE_FAN,
                 HYSEN_2PFC_MODE_COOL,
                 HYSEN_2PFC_MODE_HEAT))
-        self.get_device_status()
         if (operation_mode == HYSEN_2PFC_MODE_FAN) and \
            (self.fan_mode == HYSEN_2PFC_FAN_AUTO):
             raise ValueError(
                 'Can\'t have operation_mode \'fan_only\' and fan_mode \'auto\'.')
-        self.set_mode_fan(
+        return self._mode_fan_request(
             operation_mode,
             self.fan_mode)
+
+    def set_operation_mode(self, operation_mode):
+        self.refresh_registers(1, 1)
+        self.send_request(self._operation_mode_request(operation_mode))
+
+    async def async_set_operation_mode(self, operation_mode):
+        await self.async_refresh_registers(1, 1)
+        await self.async_send_request(self._operation_mode_request(operation_mode))
  
     # set target temperature
     # 0x01,0x06,0x00,0x02,0x00, Tt
@@ -558,8 +1183,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
     # response 0x01,0x06,0x00,0x02,0x00,Tt
     # Note: The calling method should not do anything if in ventilation mode
     #       Check temp against Sh1, Sl1 for cooling and against Sh2, Sl2 for heating
-    def set_target_temp(self, temp):
-        self.get_device_status()
+    def _target_temp_request(self, temp):
         if self.operation_mode == HYSEN_2PFC_MODE_FAN:
             raise ValueError(
                 'Can\'t set a target temperature when operation_mode is \'fan_only\'.') 
@@ -588,7 +1212,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
         _request = bytearray([0x01, 0x06, 0x00, 0x02])
         _request.append(0)
         _request.append(temp)
-        self.send_request(_request)
+        return _request
+
+    def set_target_temp(self, temp):
+        self.refresh_registers(1, 5)
+        self.send_request(self._target_temp_request(temp))
+
+    async def async_set_target_temp(self, temp):
+        await self.async_refresh_registers(1, 5)
+        await self.async_send_request(self._target_temp_request(temp))
 
     # set options
     # 0x01, 0x10, 0x00, 0x03, 0x00, 0x04, 0x08, Dif, Adj, Sh1, Sl1, Sh2, Sl2, Fan, Fre
@@ -603,7 +1235,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
     # Fre = Frost Protection, 0x00 = On, 0x01 = Off
     # confirmation response:
     # payload 0x01,0x10,0x00,0x03,0x00,0x04
-    def set_options(self, hysteresis, calibration, cooling_max_temp, cooling_min_temp, heating_max_temp, heating_min_temp, fan_control, frost_protection):
+    def _options_request(self, hysteresis, calibration, cooling_max_temp, cooling_min_temp, heating_max_temp, heating_min_temp, fan_control, frost_protection):
         # Truncate the fractional part to 1 digit 
         calibration = int(calibration * 10 // 1)
         # Convert to signed byte
@@ -617,9 +1249,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
         _request.append(heating_min_temp)
         _request.append(fan_control)
         _request.append(frost_protection)
-        self.send_request(_request)
+        return _request
 
-    def set_hysteresis(self, hysteresis):
+    def set_options(self, hysteresis, calibration, cooling_max_temp, cooling_min_temp, heating_max_temp, heating_min_temp, fan_control, frost_protection):
+        self.send_request(self._options_request(hysteresis, calibration, cooling_max_temp, cooling_min_temp, heating_max_temp, heating_min_temp, fan_control, frost_protection))
+
+    async def async_set_options(self, hysteresis, calibration, cooling_max_temp, cooling_min_temp, heating_max_temp, heating_min_temp, fan_control, frost_protection):
+        await self.async_send_request(self._options_request(hysteresis, calibration, cooling_max_temp, cooling_min_temp, heating_max_temp, heating_min_temp, fan_control, frost_protection))
+
+    def _hysteresis_request(self, hysteresis):
         if hysteresis not in [
             HYSEN_2PFC_HYSTERESIS_HALVE,
             HYSEN_2PFC_HYSTERESIS_WHOLE]:
@@ -628,8 +1266,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 hysteresis,
                 HYSEN_2PFC_HYSTERESIS_HALVE,
                 HYSEN_2PFC_HYSTERESIS_WHOLE))
-        self.get_device_status()
-        self.set_options(
+        return self._options_request(
             hysteresis,
             self.calibration,
             self.cooling_max_temp,
@@ -639,7 +1276,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             self.fan_control,
             self.frost_protection)
 
-    def set_calibration(self, calibration):
+    def set_hysteresis(self, hysteresis):
+        self.refresh_registers(3, 6)
+        self.send_request(self._hysteresis_request(hysteresis))
+
+    async def async_set_hysteresis(self, hysteresis):
+        await self.async_refresh_registers(3, 6)
+        await self.async_send_request(self._hysteresis_request(hysteresis))
+
+    def _calibration_request(self, calibration):
         if calibration < HYSEN_2PFC_CALIBRATION_MIN:
             raise ValueError(
                 'Can\'t set calibration (%s°) lower than device\'s minimum (%s°).' % ( \
@@ -650,8 +1295,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 'Can\'t set calibration (%s°) higher than device\'s maximum (%s°).' % ( \
                 calibration,
                 HYSEN_2PFC_CALIBRATION_MAX))
-        self.get_device_status()
-        self.set_options(
+        return self._options_request(
             self.hysteresis,
             calibration,
             self.cooling_max_temp,
@@ -661,8 +1305,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             self.fan_control,
             self.frost_protection)
 
-    def set_cooling_max_temp(self, cooling_max_temp):
-        self.get_device_status()
+    def set_calibration(self, calibration):
+        self.refresh_registers(3, 6)
+        self.send_request(self._calibration_request(calibration))
+
+    async def async_set_calibration(self, calibration):
+        await self.async_refresh_registers(3, 6)
+        await self.async_send_request(self._calibration_request(calibration))
+
+    def _cooling_max_temp_request(self, cooling_max_temp):
         if cooling_max_temp > HYSEN_2PFC_COOLING_MAX_TEMP:
             raise ValueError(
                 'Can\'t set cooling maximum temperature (%s°) higher than device\'s maximum (%s°).' % ( \
@@ -678,7 +1329,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 'Can\'t set cooling maximum temperature (%s°) lower than target temperature (%s°).' % ( \
                 cooling_max_temp,
                 self.target_temp))
-        self.set_options(
+        return self._options_request(
             self.hysteresis,
             self.calibration,
             cooling_max_temp,
@@ -688,8 +1339,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             self.fan_control,
             self.frost_protection)
 
-    def set_cooling_min_temp(self, cooling_min_temp):
-        self.get_device_status()
+    def set_cooling_max_temp(self, cooling_max_temp):
+        self.refresh_registers(2, 6)
+        self.send_request(self._cooling_max_temp_request(cooling_max_temp))
+
+    async def async_set_cooling_max_temp(self, cooling_max_temp):
+        await self.async_refresh_registers(2, 6)
+        await self.async_send_request(self._cooling_max_temp_request(cooling_max_temp))
+
+    def _cooling_min_temp_request(self, cooling_min_temp):
         if cooling_min_temp < HYSEN_2PFC_COOLING_MIN_TEMP:
             raise ValueError(
                 'Can\'t set cooling minimum temperature (%s°) lower than device\'s minimum (%s°).' % ( \
@@ -705,7 +1363,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 'Can\'t set cooling minimum temperature (%s°) higher than target temperature (%s°).' % ( \
                 cooling_min_temp,
                 self.target_temp))
-        self.set_options(
+        return self._options_request(
             self.hysteresis,
             self.calibration,
             self.cooling_max_temp,
@@ -715,8 +1373,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             self.fan_control,
             self.frost_protection)
 
-    def set_heating_max_temp(self, heating_max_temp):
-        self.get_device_status()
+    def set_cooling_min_temp(self, cooling_min_temp):
+        self.refresh_registers(2, 6)
+        self.send_request(self._cooling_min_temp_request(cooling_min_temp))
+
+    async def async_set_cooling_min_temp(self, cooling_min_temp):
+        await self.async_refresh_registers(2, 6)
+        await self.async_send_request(self._cooling_min_temp_request(cooling_min_temp))
+
+    def _heating_max_temp_request(self, heating_max_temp):
         if heating_max_temp > HYSEN_2PFC_HEATING_MAX_TEMP:
             raise ValueError(
                 'Can\'t set heating maximum temperature (%s°) higher than device\'s maximum (%s°).' % ( \
@@ -732,7 +1397,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 'Can\'t set heating maximum temperature (%s°) lower than target temperature (%s°).' % ( \
                  heating_max_temp,
                 self.target_temp))
-        self.set_options(
+        return self._options_request(
             self.hysteresis,
             self.calibration,
             self.cooling_max_temp,
@@ -742,8 +1407,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             self.fan_control,
             self.frost_protection)
 
-    def set_heating_min_temp(self, heating_min_temp):
-        self.get_device_status()
+    def set_heating_max_temp(self, heating_max_temp):
+        self.refresh_registers(2, 6)
+        self.send_request(self._heating_max_temp_request(heating_max_temp))
+
+    async def async_set_heating_max_temp(self, heating_max_temp):
+        await self.async_refresh_registers(2, 6)
+        await self.async_send_request(self._heating_max_temp_request(heating_max_temp))
+
+    def _heating_min_temp_request(self, heating_min_temp):
         if heating_min_temp < HYSEN_2PFC_HEATING_MIN_TEMP:
             raise ValueError(
                 'Can\'t set heating minimum temperature (%s°) lower than device\'s minimum (%s°).' % ( \
@@ -759,7 +1431,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 'Can\'t set heating minimum temperature (%s°) higher than target temperature (%s°).' % ( \
                 heating_min_temp,
                 self.target_temp))
-        self.set_options(
+        return self._options_request(
             self.hysteresis,
             self.calibration,
             self.cooling_max_temp,
@@ -769,7 +1441,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             self.fan_control,
             self.frost_protection)
 
-    def set_fan_control(self, fan_control):
+    def set_heating_min_temp(self, heating_min_temp):
+        self.refresh_registers(2, 6)
+        self.send_request(self._heating_min_temp_request(heating_min_temp))
+
+    async def async_set_heating_min_temp(self, heating_min_temp):
+        await self.async_refresh_registers(2, 6)
+        await self.async_send_request(self._heating_min_temp_request(heating_min_temp))
+
+    def _fan_control_request(self, fan_control):
         if fan_control not in [
             HYSEN_2PFC_FAN_CONTROL_ON,
             HYSEN_2PFC_FAN_CONTROL_OFF]:
@@ -778,8 +1458,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 fan_control,
                 HYSEN_2PFC_FAN_CONTROL_ON,
                 HYSEN_2PFC_FAN_CONTROL_OFF))
-        self.get_device_status()
-        self.set_options(
+        return self._options_request(
             self.hysteresis,
             self.calibration,
             self.cooling_max_temp,
@@ -789,7 +1468,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             fan_control,
             self.frost_protection)
 
-    def set_frost_protection(self, frost_protection):
+    def set_fan_control(self, fan_control):
+        self.refresh_registers(3, 6)
+        self.send_request(self._fan_control_request(fan_control))
+
+    async def async_set_fan_control(self, fan_control):
+        await self.async_refresh_registers(3, 6)
+        await self.async_send_request(self._fan_control_request(fan_control))
+
+    def _frost_protection_request(self, frost_protection):
         if frost_protection not in [
             HYSEN_2PFC_FROST_PROTECTION_OFF,
             HYSEN_2PFC_FROST_PROTECTION_ON]:
@@ -798,8 +1485,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 frost_protection,
                 HYSEN_2PFC_FROST_PROTECTION_OFF,
                 HYSEN_2PFC_FROST_PROTECTION_ON))
-        self.get_device_status()
-        self.set_options(
+        return self._options_request(
             self.hysteresis,
             self.calibration,
             self.cooling_max_temp,
@@ -809,6 +1495,14 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             self.fan_control,
             frost_protection)
 
+    def set_frost_protection(self, frost_protection):
+        self.refresh_registers(3, 6)
+        self.send_request(self._frost_protection_request(frost_protection))
+
+    async def async_set_frost_protection(self, frost_protection):
+        await self.async_refresh_registers(3, 6)
+        await self.async_send_request(self._frost_protection_request(frost_protection))
+
     # set time
     # 0x01, 0x10, 0x00, 0x07, 0x00, 0x02, 0x04, hh, mm, ss, wd
     # hh = Time hour past midnight
@@ -817,7 +1511,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
     # wd = Weekday 0x01 = Monday, 0x02 = Tuesday, ..., 0x06 = Saturday, 0x07 = Sunday
     # confirmation response:
     # payload 0x01, 0x10, 0x00, 0x07, 0x00, 0x02
-    def set_time(self, clock_hour, clock_minute, clock_second, clock_weekday):
+    def _time_request(self, clock_hour, clock_minute, clock_second, clock_weekday):
         if (clock_weekday < 1) or (clock_weekday > 7):
             raise ValueError(
                 'Weekday (%s) has to be between 1 (Monday) and 7 (Saturday).' % ( \
@@ -839,7 +1533,62 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
         _request.append(clock_minute)
         _request.append(clock_second)
         _request.append(clock_weekday)
-        self.send_request(_request)
+        return _request
+
+    def set_time(self, clock_hour, clock_minute, clock_second, clock_weekday):
+        self.send_request(self._time_request(clock_hour, clock_minute, clock_second, clock_weekday))
+        self.clock.reset()
+
+    async def async_set_time(self, clock_hour, clock_minute, clock_second, clock_weekday):
+        await self.async_send_request(self._time_request(clock_hour, clock_minute, clock_second, clock_weekday))
+        self.clock.reset()
+
+    # Feed the clock words read last to the drift model, local_now is the local time
+    # now as a datetime. Returns the offset of the device clock predicted for now, in seconds
+    def clock_error(self, local_now):
+        now = time.monotonic()
+        if self.clock_read_time is not None and self.clock_read_time != self.clock_sample_time:
+            local_seconds = (
+                (local_now.isoweekday() - 1) * 86400 + local_now.hour * 3600
+                + local_now.minute * 60 + local_now.second + local_now.microsecond / 1e6
+                - (now - self.clock_read_time))
+            device_seconds = (
+                (self.status.clock_weekday - 1) * 86400 + self.status.clock_hour * 3600
+                + self.status.clock_min * 60 + self.status.clock_sec)
+            self.clock.sample(self.clock_read_time, local_seconds, device_seconds)
+            self.clock_sample_time = self.clock_read_time
+        return self.clock.predict(now)
+
+    # Seconds from now until the periods switch the device by itself, by its own clock
+    # None while the status is unknown, no period is enabled or a day whose programme
+    # is not decoded comes first
+    def next_transition(self):
+        if self.clock_read_time is None or None in self.registers_time:
+            return None
+        status = self.status
+        edges = [
+            getattr(status, hour) * 3600 + getattr(status, minute) * 60
+            for enabled, hour, minute in HYSEN_2PFC_PERIOD_EDGES
+            if getattr(status, enabled) == HYSEN_2PFC_PERIOD_ENABLED]
+        if not edges:
+            return None
+        device_now = (
+            (status.clock_weekday - 1) * 86400 + status.clock_hour * 3600
+            + status.clock_min * 60 + status.clock_sec
+            + time.monotonic() - self.clock_read_time)
+        days = HYSEN_2PFC_SCHEDULE_DAYS.get(
+            status.schedule, HYSEN_2PFC_SCHEDULE_DAYS[HYSEN_2PFC_SCHEDULE_1234567])
+        today = int(device_now // 86400)
+        for day in range(today, today + 8):
+            # the programme of the remaining days is unknown, up to the normal polls
+            if day % 7 + 1 not in days:
+                return None
+            upcoming = [
+                day * 86400 + edge - device_now
+                for edge in edges if day * 86400 + edge > device_now]
+            if upcoming:
+                return min(upcoming)
+        return None
 
     # set weekly schedule
     # 0x01, 0x10, 0x00, 0x09, 0x00, 0x01, 0x02, 0x00, Lm
@@ -847,7 +1596,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
     # Lm = Weekly schedule, 0x00 = Today, 0x01 = 12345_67, 0x02 = 123456_7, 0x03 = 1234567
     # confirmation response:
     # payload 0x01, 0x10, 0x00, 0x09, 0x00, 0x01
-    def set_weekly_schedule(self, schedule):
+    def _weekly_schedule_request(self, schedule):
         if schedule not in [
             HYSEN_2PFC_SCHEDULE_TODAY,
             HYSEN_2PFC_SCHEDULE_12345_67,
@@ -863,7 +1612,13 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
         _request = bytearray([0x01, 0x10, 0x00, 0x09, 0x00, 0x01, 0x02])
         _request.append(0)
         _request.append(schedule)
-        self.send_request(_request)
+        return _request
+
+    def set_weekly_schedule(self, schedule):
+        self.send_request(self._weekly_schedule_request(schedule))
+
+    async def async_set_weekly_schedule(self, schedule):
+        await self.async_send_request(self._weekly_schedule_request(schedule))
 
     # set daily schedule
     # 0x01, 0x10, 0x00, 0x0A, 0x00, 0x04, 0x08, P1OnH, P1OnM, P1OffH, P1OffM, P2OnH, P2OnM, P2OffH, P2OffM
@@ -877,7 +1632,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
     # P2OffM = Period2 Off Minute past hour
     # confirmation response:
     # payload 0x01, 0x10, 0x00, 0x0A, 0x00, 0x04
-    def set_daily_schedule(self, period1_on_enabled, period1_on_hour, period1_on_min, period1_off_enabled, period1_off_hour, period1_off_min, period2_on_enabled, period2_on_hour, period2_on_min, period2_off_enabled, period2_off_hour, period2_off_min):
+    def _daily_schedule_request(self, period1_on_enabled, period1_on_hour, period1_on_min, period1_off_enabled, period1_off_hour, period1_off_min, period2_on_enabled, period2_on_hour, period2_on_min, period2_off_enabled, period2_off_hour, period2_off_min):
         _request = bytearray([0x01, 0x10, 0x00, 0x0A, 0x00, 0x04, 0x08])
         _request.append((period1_on_enabled << 7) + period1_on_hour)
         _request.append(period1_on_min)
@@ -887,10 +1642,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
         _request.append(period2_on_min)
         _request.append((period2_off_enabled << 7) + period2_off_hour)
         _request.append(period2_off_min)
-        self.send_request(_request)
+        return _request
 
-    def set_period1_on(self, period1_on_enabled = None, period1_on_hour = None, period1_on_min = None):
-        self.get_device_status()
+    def set_daily_schedule(self, period1_on_enabled, period1_on_hour, period1_on_min, period1_off_enabled, period1_off_hour, period1_off_min, period2_on_enabled, period2_on_hour, period2_on_min, period2_off_enabled, period2_off_hour, period2_off_min):
+        self.send_request(self._daily_schedule_request(period1_on_enabled, period1_on_hour, period1_on_min, period1_off_enabled, period1_off_hour, period1_off_min, period2_on_enabled, period2_on_hour, period2_on_min, period2_off_enabled, period2_off_hour, period2_off_min))
+
+    async def async_set_daily_schedule(self, period1_on_enabled, period1_on_hour, period1_on_min, period1_off_enabled, period1_off_hour, period1_off_min, period2_on_enabled, period2_on_hour, period2_on_min, period2_off_enabled, period2_off_hour, period2_off_min):
+        await self.async_send_request(self._daily_schedule_request(period1_on_enabled, period1_on_hour, period1_on_min, period1_off_enabled, period1_off_hour, period1_off_min, period2_on_enabled, period2_on_hour, period2_on_min, period2_off_enabled, period2_off_hour, period2_off_min))
+
+    def _period1_on_request(self, period1_on_enabled = None, period1_on_hour = None, period1_on_min = None):
         if period1_on_enabled is None:
             period1_on_enabled = self.period1_on_enabled
         if period1_on_hour is None:
@@ -921,7 +1681,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 period1_on_min,
                 self.period1_off_hour,
                 self.period1_off_min))
-        self.set_daily_schedule(
+        return self._daily_schedule_request(
             period1_on_enabled,
             period1_on_hour,
             period1_on_min,
@@ -935,7 +1695,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             self.period2_off_hour,
             self.period2_off_min)
 
-    def set_period1_off(self, period1_off_enabled = None, period1_off_hour = None, period1_off_min = None):
+    def set_period1_on(self, period1_on_enabled = None, period1_on_hour = None, period1_on_min = None):
+        self.refresh_registers(10, 13)
+        self.send_request(self._period1_on_request(period1_on_enabled, period1_on_hour, period1_on_min))
+
+    async def async_set_period1_on(self, period1_on_enabled = None, period1_on_hour = None, period1_on_min = None):
+        await self.async_refresh_registers(10, 13)
+        await self.async_send_request(self._period1_on_request(period1_on_enabled, period1_on_hour, period1_on_min))
+
+    def _period1_off_request(self, period1_off_enabled = None, period1_off_hour = None, period1_off_min = None):
         if period1_off_enabled is None:
             period1_off_enabled = self.period1_off_enabled
         if period1_off_hour is None:
@@ -974,8 +1742,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 period1_off_min,
                 self.period2_on_hour,
                 self.period2_on_min))
-        self.get_device_status()
-        self.set_daily_schedule(
+        return self._daily_schedule_request(
             self.period1_on_enabled,
             self.period1_on_hour,
             self.period1_on_min,
@@ -989,7 +1756,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             self.period2_off_hour,
             self.period2_off_min)
 
-    def set_period2_on(self, period2_on_enabled = None, period2_on_hour = None, period2_on_min = None):
+    def set_period1_off(self, period1_off_enabled = None, period1_off_hour = None, period1_off_min = None):
+        self.refresh_registers(10, 13)
+        self.send_request(self._period1_off_request(period1_off_enabled, period1_off_hour, period1_off_min))
+
+    async def async_set_period1_off(self, period1_off_enabled = None, period1_off_hour = None, period1_off_min = None):
+        await self.async_refresh_registers(10, 13)
+        await self.async_send_request(self._period1_off_request(period1_off_enabled, period1_off_hour, period1_off_min))
+
+    def _period2_on_request(self, period2_on_enabled = None, period2_on_hour = None, period2_on_min = None):
         if period2_on_enabled is None:
             period2_on_enabled = self.period2_on_enabled
         if period2_on_hour is None:
@@ -1028,8 +1803,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 period2_on_min,
                 self.period2_off_hour,
                 self.period2_off_min))
-        self.get_device_status()
-        self.set_daily_schedule(
+        return self._daily_schedule_request(
             self.period1_on_enabled,
             self.period1_on_hour,
             self.period1_on_min,
@@ -1043,7 +1817,15 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             self.period2_off_hour,
             self.period2_off_min)
 
-    def set_period2_off(self, period2_off_enabled = None, period2_off_hour = None, period2_off_min = None):
+    def set_period2_on(self, period2_on_enabled = None, period2_on_hour = None, period2_on_min = None):
+        self.refresh_registers(10, 13)
+        self.send_request(self._period2_on_request(period2_on_enabled, period2_on_hour, period2_on_min))
+
+    async def async_set_period2_on(self, period2_on_enabled = None, period2_on_hour = None, period2_on_min = None):
+        await self.async_refresh_registers(10, 13)
+        await self.async_send_request(self._period2_on_request(period2_on_enabled, period2_on_hour, period2_on_min))
+
+    def _period2_off_request(self, period2_off_enabled = None, period2_off_hour = None, period2_off_min = None):
         if period2_off_enabled is None:
             period2_off_enabled = self.period2_off_enabled
         if period2_off_hour is None:
@@ -1074,8 +1856,7 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
                 period2_off_min,
                 self.period2_on_hour,
                 self.period2_on_min))
-        self.get_device_status()
-        self.set_daily_schedule(
+        return self._daily_schedule_request(
             self.period1_on_enabled,
             self.period1_on_hour,
             self.period1_on_min,
@@ -1089,6 +1870,249 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
             period2_off_hour,
             period2_off_min)
 
+    def set_period2_off(self, period2_off_enabled = None, period2_off_hour = None, period2_off_min = None):
+        self.refresh_registers(10, 13)
+        self.send_request(self._period2_off_request(period2_off_enabled, period2_off_hour, period2_off_min))
+
+    async def async_set_period2_off(self, period2_off_enabled = None, period2_off_hour = None, period2_off_min = None):
+        await self.async_refresh_registers(10, 13)
+        await self.async_send_request(self._period2_off_request(period2_off_enabled, period2_off_hour, period2_off_min))
+
+    # Bring the device to desired_state, a dict of status field names and values
+    # Fields already at the desired value are not written, the changed words are
+    # written with as few 0x06 (one word) and 0x10 (adjacent words) requests as
+    # possible. Returns the number of requests sent.
+    # e.g. apply({'hysteresis': 0, 'calibration': 1.5, 'heating_max_temp': 35, 'heating_min_temp': 15})
+    #      sends a single 0x10 write of words 3 to 5
+    def apply(self, desired_state):
+        self.refresh_registers(*self._apply_words(desired_state))
+        _requests = self._apply_requests(desired_state)
+        for _request in _requests:
+            self.send_request(_request)
+        return len(_requests)
+
+    async def async_apply(self, desired_state):
+        await self.async_refresh_registers(*self._apply_words(desired_state))
+        _requests = self._apply_requests(desired_state)
+        for _request in _requests:
+            await self.async_send_request(_request)
+        return len(_requests)
+
+    # Debounced apply: desired_state is written once the words it touches were left
+    # unchanged for debounce_delay seconds, values superseded in the meantime are never
+    # sent (last write wins). Until written the pending values are read back instead of
+    # the status. Returns a future resolved once every field of desired_state was written.
+    def apply_later(self, desired_state):
+        self._apply_words(desired_state)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.update(desired_state)
+        self.pending_waiters.append((future, set(desired_state)))
+        deadline = loop.time() + self.debounce_delay
+        for word in set(HYSEN_2PFC_STATUS_FIELDS[name][0] // 2 for name in desired_state):
+            if word in self.pending_timers:
+                self.pending_timers[word].cancel()
+            self.pending_deadlines[word] = deadline
+            self.pending_timers[word] = loop.call_at(deadline, self._debounce_expired)
+        return future
+
+    def _debounce_expired(self):
+        asyncio.ensure_future(self._async_debounce_flush())
+
+    # Write the fields of every word due, words due together are merged by async_apply
+    async def _async_debounce_flush(self):
+        now = asyncio.get_running_loop().time()
+        words = [word for word, deadline in self.pending_deadlines.items() if deadline <= now]
+        for word in words:
+            del self.pending_deadlines[word]
+            self.pending_timers.pop(word).cancel()
+        fields = dict(
+            (name, value) for name, value in self.pending.items()
+            if HYSEN_2PFC_STATUS_FIELDS[name][0] // 2 in words)
+        if not fields:
+            return
+        written = set(fields)
+        # this write answers the callers waiting when it is sent, with the values they
+        # asked for or superseded by (last write wins). Callers joining while it is in
+        # flight asked for newer values, they wait for the next flush
+        answered = set(id(future) for future, names in self.pending_waiters if names & written)
+        try:
+            await self.async_apply(fields)
+            error = None
+        except Exception as exc:
+            error = exc
+        for name, value in fields.items():
+            # a newer value set while writing stays pending, it has its own deadline
+            if HYSEN_2PFC_STATUS_FIELDS[name][0] // 2 not in self.pending_deadlines:
+                self.pending.pop(name, None)
+        reported = error is None
+        waiters = []
+        for future, names in self.pending_waiters:
+            if id(future) not in answered:
+                waiters.append((future, names))
+                continue
+            if error is not None:
+                if not future.done():
+                    future.set_exception(error)
+                    reported = True
+                continue
+            names -= written
+            if not names:
+                if not future.done():
+                    future.set_result(None)
+                continue
+            waiters.append((future, names))
+        self.pending_waiters = waiters
+        if not reported:
+            # every caller of this write has gone, the failure would pass unnoticed
+            _LOGGER.error("[%s] delayed write of %s failed: %s",
+                self.host, ', '.join(sorted(fields)), error)
+
+    # Pending writes are dropped, their callers get an error
+    def close(self):
+        for handle in self.pending_timers.values():
+            handle.cancel()
+        for future, _names in self.pending_waiters:
+            if not future.done():
+                future.set_exception(ConnectionAbortedError('device closed'))
+        self.pending = {}
+        self.pending_waiters = []
+        self.pending_deadlines = {}
+        self.pending_timers = {}
+        broadlink_device.close(self)
+
+    # First and last word the validation of desired_state depends on
+    def _apply_words(self, desired_state):
+        words = set()
+        for name in desired_state:
+            if name not in HYSEN_2PFC_STATUS_FIELDS:
+                raise ValueError('Can\'t set unknown field (%s).' % name)
+            words.add(HYSEN_2PFC_STATUS_FIELDS[name][0] // 2)
+        # mode, target and limits are checked against each other, as are the periods
+        if words & set(range(1, 7)):
+            words.update(range(1, 7))
+        if words & set(range(10, 14)):
+            words.update(range(10, 14))
+        if not words:
+            return 0, -1
+        return min(words), max(words)
+
+    def _apply_requests(self, desired_state):
+        desired_state = dict(desired_state)
+        for name in desired_state:
+            if name in HYSEN_2PFC_READ_ONLY_FIELDS:
+                raise ValueError('Can\'t set %s, the device maintains it.' % name)
+        # If remote lock is Off then key lock has to be unlocked, see set_lock_power
+        if ('key_lock' in desired_state) and ('remote_lock' not in desired_state):
+            if desired_state['key_lock'] == HYSEN_2PFC_KEY_ALL_UNLOCKED:
+                desired_state['remote_lock'] = HYSEN_2PFC_REMOTE_LOCK_OFF
+            else:
+                desired_state['remote_lock'] = HYSEN_2PFC_REMOTE_LOCK_ON
+
+        registers = bytearray(self.registers)
+        for name, value in desired_state.items():
+            index, shift, mask = HYSEN_2PFC_STATUS_FIELDS[name]
+            if name in HYSEN_2PFC_STATUS_SCALE:
+                # Truncate the fractional part to 1 digit, as a signed byte
+                value = int(value * HYSEN_2PFC_STATUS_SCALE[name] // 1) & 0xFF
+            if mask is None:
+                mask = 0xFF
+            registers[index] = (registers[index] & ~(mask << shift)) | ((value & mask) << shift)
+
+        changed = set(name for name in desired_state if getattr(self.status, name) != desired_state[name])
+        self._apply_validate(Hysen2PipeFanCoilStatus.from_registers(registers), desired_state, changed)
+
+        words = [
+            word for word in range(HYSEN_2PFC_REGISTER_WORDS)
+            if registers[2 * word:2 * word + 2] != self.registers[2 * word:2 * word + 2]]
+        # merge words into runs, across short gaps of unchanged words that can be rewritten as they are
+        runs = []
+        for word in words:
+            if runs and (word - runs[-1][1] - 1 <= HYSEN_2PFC_WRITE_MAX_GAP) and \
+               not set(range(runs[-1][1] + 1, word)) & set(HYSEN_2PFC_VOLATILE_WORDS):
+                runs[-1][1] = word
+            else:
+                runs.append([word, word])
+
+        _requests = []
+        for first, last in runs:
+            # the bits the device maintains are sent as 0, like the setters do
+            data = bytes(
+                value & ~mask & 0xFF
+                for value, mask in zip(
+                    registers[2 * first:2 * last + 2],
+                    HYSEN_2PFC_REGISTER_READ_ONLY[2 * first:2 * last + 2]))
+            if first == last:
+                _request = bytearray([0x01, 0x06, 0x00, first])
+            else:
+                _request = bytearray([0x01, 0x10, 0x00, first, 0x00, last - first + 1, len(data)])
+            _request.extend(data)
+            _requests.append(_request)
+        return _requests
+
+    # Checks of the resulting status, limited to those involving a changed field
+    def _apply_validate(self, status, desired_state, changed):
+        for name in changed:
+            value = desired_state[name]
+            if name in HYSEN_2PFC_ADMITTED_VALUES and value not in HYSEN_2PFC_ADMITTED_VALUES[name]:
+                raise ValueError(
+                    'Can\'t set %s (%s) outside device\'s admitted values %s.' % ( \
+                    name,
+                    value,
+                    HYSEN_2PFC_ADMITTED_VALUES[name]))
+            if name in HYSEN_2PFC_ADMITTED_RANGES:
+                low, high = HYSEN_2PFC_ADMITTED_RANGES[name]
+                if (value < low) or (value > high):
+                    raise ValueError(
+                        'Can\'t set %s (%s) outside device\'s range (%s) to (%s).' % ( \
+                        name,
+                        value,
+                        low,
+                        high))
+        if changed & {'operation_mode', 'fan_mode'} and \
+           (status.operation_mode == HYSEN_2PFC_MODE_FAN) and \
+           (status.fan_mode == HYSEN_2PFC_FAN_AUTO):
+            raise ValueError(
+                'Can\'t have fan_mode \'auto\' and operation_mode \'fan_only\'.')
+        if changed & {'cooling_max_temp', 'cooling_min_temp'} and \
+           (status.cooling_min_temp > status.cooling_max_temp):
+            raise ValueError(
+                'Can\'t set cooling minimum temperature (%s°) higher than maximum (%s°).' % ( \
+                status.cooling_min_temp,
+                status.cooling_max_temp))
+        if changed & {'heating_max_temp', 'heating_min_temp'} and \
+           (status.heating_min_temp > status.heating_max_temp):
+            raise ValueError(
+                'Can\'t set heating minimum temperature (%s°) higher than maximum (%s°).' % ( \
+                status.heating_min_temp,
+                status.heating_max_temp))
+        if changed & {'operation_mode', 'target_temp', 'cooling_max_temp', 'cooling_min_temp', 'heating_max_temp', 'heating_min_temp'}:
+            if status.operation_mode == HYSEN_2PFC_MODE_FAN:
+                if 'target_temp' in changed:
+                    raise ValueError(
+                        'Can\'t set a target temperature when operation_mode is \'fan_only\'.')
+            else:
+                if status.operation_mode == HYSEN_2PFC_MODE_HEAT:
+                    low, high = status.heating_min_temp, status.heating_max_temp
+                else:
+                    low, high = status.cooling_min_temp, status.cooling_max_temp
+                if (status.target_temp < low) or (status.target_temp > high):
+                    raise ValueError(
+                        'Can\'t have a target temperature (%s°) outside the limits set (%s°) to (%s°).' % ( \
+                        status.target_temp,
+                        low,
+                        high))
+        if [name for name in changed if name.startswith('period')]:
+            times = [
+                (status.period1_on_hour, status.period1_on_min),
+                (status.period1_off_hour, status.period1_off_min),
+                (status.period2_on_hour, status.period2_on_min),
+                (status.period2_off_hour, status.period2_off_min)]
+            if times != sorted(set(times)):
+                raise ValueError(
+                    'Can\'t set periods out of order, period1 on %s:%s, off %s:%s, period2 on %s:%s, off %s:%s.' % \
+                    tuple(value for period in times for value in period))
+
     # get device status
     # 0x01, 0x03, 0x00, 0x00, 0x00, 0x10
     # response:
@@ -1128,47 +2152,131 @@ class Hysen2PipeFanCoilDevice(broadlink_device):
     # Tv3 = Total time valve on in seconds
     # Tv3 = Total time valve on in seconds
     # Tv4 = Total time valve on in seconds LSByte
-    def get_device_status(self):
-        _request = bytearray([0x01, 0x03, 0x00, 0x00, 0x00, 0x10])
-        _response = self.send_request(_request)
-#        _LOGGER.debug("[%s] get_device_status : %s", 
-#            self._host, 
-#            ' '.join(format(x, '02x') for x in bytearray(_response)))
-        self.remote_lock =  (_response[3]>>4) & 1
-        self.key_lock = _response[3] & 3
-        self.valve_state =  (_response[4]>>4) & 1
-        self.power_state =  _response[4] & 1
-        self.operation_mode = _response[5]
-        self.fan_mode = _response[6]
-        self.room_temp = _response[7]
-        self.target_temp = _response[8]
-        self.hysteresis = _response[9]
-        self.calibration = _response[10]
-        if self.calibration > 0x7F:
-            self.calibration = self.calibration - 0x100
-        self.calibration = float(self.calibration/10.0)
-        self.cooling_max_temp = _response[11]
-        self.cooling_min_temp = _response[12]
-        self.heating_max_temp = _response[13]
-        self.heating_min_temp = _response[14]
-        self.fan_control = _response[15]
-        self.frost_protection = _response[16]
-        self.clock_hour = _response[17]
-        self.clock_min = _response[18]
-        self.clock_sec = _response[19]
-        self.clock_weekday = _response[20]
-        self.unknown = _response[21]
-        self.schedule = _response[22]
-        self.period1_on_enabled = (_response[23]>>7) & 1
-        self.period1_on_hour = _response[23] & 0x1F
-        self.period1_on_min = _response[24] & 0x3F
-        self.period1_off_enabled = (_response[25]>>7) & 1
-        self.period1_off_hour = _response[25] & 0x1F
-        self.period1_off_min = _response[26] & 0x3F
-        self.period2_on_enabled = (_response[27]>>7) & 1
-        self.period2_on_hour = _response[27] & 0x1F
-        self.period2_on_min = _response[28] & 0x3F
-        self.period2_off_enabled = (_response[29]>>7) & 1
-        self.period2_off_hour = _response[29] & 0x1F
-        self.period2_off_min = _response[30] & 0x3F
-        self.time_valve_on = (_response[31] << 24) + (_response[32] << 16) + (_response[33] << 8) + _response[34]
+    # Words first to last can be read on their own, by default the whole file
+    def _device_status_request(self, first=0, last=HYSEN_2PFC_REGISTER_WORDS - 1):
+        if not 0 <= first <= last < HYSEN_2PFC_REGISTER_WORDS:
+            raise ValueError('Can\'t read status words (%s) to (%s)' % (first, last))
+        return bytearray([0x01, 0x03, 0x00, first, 0x00, last - first + 1])
+
+    # the answer is mirrored by send_request, which decodes the status from it
+    def get_device_status(self, first=0, last=HYSEN_2PFC_REGISTER_WORDS - 1):
+        self.send_request(self._device_status_request(first, last))
+
+    async def async_get_device_status(self, first=0, last=HYSEN_2PFC_REGISTER_WORDS - 1):
+        await self.async_send_request(self._device_status_request(first, last))
+
+    # Poll read: the hot words every time, the valve counter while it moves, the whole
+    # file while a word is unknown, older than cold_max_age or written since last read
+    # Returns True if the whole file was read
+    async def async_poll_status(self):
+        if (None in self.registers_time or self.registers_written
+                or not self.registers_fresh(0, HYSEN_2PFC_REGISTER_WORDS - 1, self.cold_max_age)):
+            await self.async_get_device_status()
+            self.valve_counter_moving = self.status.valve_state == HYSEN_2PFC_VALVE_ON
+            return True
+        await self.async_get_device_status(*HYSEN_2PFC_HOT_WORDS)
+        # read once more after the valve closed, for the final count
+        valve_on = self.status.valve_state == HYSEN_2PFC_VALVE_ON
+        if valve_on or self.valve_counter_moving:
+            await self.async_get_device_status(*HYSEN_2PFC_VALVE_COUNTER_WORDS)
+        self.valve_counter_moving = valve_on
+        return False
+
+    # Requests go through the register mirror
+    # a read stores the words returned, a confirmed write the words sent
+    def send_request(self, input_payload):
+        return_payload = broadlink_device.send_request(self, input_payload)
+        self._registers_update(input_payload, return_payload)
+        return return_payload
+
+    async def async_send_request(self, input_payload):
+        return_payload = await broadlink_device.async_send_request(self, input_payload)
+        self._registers_update(input_payload, return_payload)
+        return return_payload
+
+    def _registers_update(self, input_payload, return_payload):
+        word = input_payload[3]
+        if input_payload[1] == 0x03:
+            data = return_payload[3:3 + return_payload[2]]
+        elif input_payload[1] == 0x06:
+            data = input_payload[4:6]
+        elif input_payload[1] == 0x10:
+            data = input_payload[7:7 + 2 * input_payload[5]]
+        else:
+            return
+        start = 2 * word
+        end = start + len(data)
+        if input_payload[1] != 0x03:
+            data = bytes(
+                (new & ~mask) | (old & mask)
+                for new, old, mask in zip(
+                    data, self.registers[start:end], HYSEN_2PFC_REGISTER_READ_ONLY[start:end]))
+        words = range(word, word + len(data) // 2)
+        previous = bytes(self.registers[start:end])
+        if previous != data:
+            self.registers_decoded = False
+            changed = set(
+                index for offset, index in enumerate(words)
+                if previous[2 * offset:2 * offset + 2] != data[2 * offset:2 * offset + 2])
+            changed.difference_update(HYSEN_2PFC_VOLATILE_WORDS)
+            if changed:
+                self.registers_version += 1
+            # the valve counter moves every second the unit heats or cools
+            if changed.difference(HYSEN_2PFC_VALVE_COUNTER_WORDS):
+                self.control_version += 1
+        self.registers[start:end] = data
+        now = time.monotonic()
+        for index in words:
+            self.registers_time[index] = now
+        # a time written is as good as one read
+        if 7 in words and 8 in words:
+            self.clock_read_time = now - (self.rtt.srtt or 0) / 2
+        if input_payload[1] == 0x03:
+            self.registers_written.difference_update(words)
+        else:
+            self.registers_written.update(words)
+            if self.on_write is not None:
+                self.on_write()
+        # a partially known register file would decode to garbage
+        if None not in self.registers_time and not self.registers_decoded:
+            self.status = Hysen2PipeFanCoilStatus.from_registers(self.registers)
+            self.registers_decoded = True
+
+    # True if words first to last were confirmed by the device within max_age seconds
+    def registers_fresh(self, first, last, max_age=None):
+        if max_age is None:
+            max_age = self.register_max_age
+        oldest = time.monotonic() - max_age
+        return all(
+            confirmed is not None and confirmed >= oldest
+            for confirmed in self.registers_time[first:last + 1])
+
+    # Read words first to last only if one a setter depends on is not fresh
+    # the whole file is read until the status could be decoded once
+    def refresh_registers(self, first, last):
+        if not self.registers_fresh(first, last):
+            if None in self.registers_time:
+                self.get_device_status()
+            else:
+                self.get_device_status(first, last)
+
+    async def async_refresh_registers(self, first, last):
+        if not self.registers_fresh(first, last):
+            if None in self.registers_time:
+                await self.async_get_device_status()
+            else:
+                await self.async_get_device_status(first, last)
+
+# Status fields read through the current snapshot, e.g. device.room_temp,
+# a value waiting in apply_later() is returned instead
+def _status_property(name):
+    status_field = operator.attrgetter('status.' + name)
+    def getter(self):
+        if name in self.pending:
+            return self.pending[name]
+        return status_field(self)
+    return property(getter)
+
+for _field in Hysen2PipeFanCoilStatus._fields:
+    setattr(Hysen2PipeFanCoilDevice, _field, _status_property(_field))
+del _field
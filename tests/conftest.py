@@ -0,0 +1,21 @@
+"""
+The protocol modules do not depend on Home Assistant, they are imported
+directly from the component directory without loading the integration
+"""
+
+import os
+import sys
+import types
+
+COMPONENT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "config", "custom_components", "hysen2pfc")
+
+sys.path.insert(0, COMPONENT_DIR)
+
+# hysen2pfc_device uses relative imports, its package is registered without
+# running __init__.py, which needs Home Assistant
+if "hysen2pfc" not in sys.modules:
+    package = types.ModuleType("hysen2pfc")
+    package.__path__ = [COMPONENT_DIR]
+    sys.modules["hysen2pfc"] = package
@@ -0,0 +1,62 @@
+"""
+HY03AC stand-in answering requests from a register file of its own, below
+the register mirror and without network or encryption
+"""
+
+import asyncio
+
+from hysen2pfc.hysen2pfc_device import (
+    HYSEN_2PFC_DEV_TYPE,
+    HYSEN_2PFC_REGISTER_READ_ONLY,
+    Hysen2PipeFanCoilDevice,
+)
+
+# power on with the valve open, heating to 22° in a room at 23°, calibration 0,
+# limits 40/10, clock Wednesday 14:30:05, period 1 on at 8:00, valve on for 123456 s
+REGISTERS = bytes.fromhex(
+    "0011 0301 1716 0100 280a 280a 0001 0e1e 0503 0003 8800 1200 0000 0000 0001 e240")
+
+
+class simulated_hysen(Hysen2PipeFanCoilDevice):
+    """Device whose answers come from device_registers; requests are kept in sent."""
+
+    def __init__(self, registers=REGISTERS):
+        super().__init__(("127.0.0.1", 80), bytes(6), HYSEN_2PFC_DEV_TYPE, 10)
+        self.device_registers = bytearray(registers)
+        self.sent = []
+        # seconds each exchange takes, and the errors the next writes fail with
+        # (None lets a write through)
+        self.delay = 0
+        self.write_errors = []
+
+    def send_packet(self, command, payload):
+        return bytes(payload)
+
+    async def _async_exchange(self, command, payload, hedge=False):
+        await asyncio.sleep(self.delay)
+        return bytes(payload), self.session_generation
+
+    # the request travels as payload: length, request, CRC
+    def _session_response(self, input_payload, response):
+        request = bytes(input_payload)
+        self.sent.append(request)
+        start = 2 * request[3]
+        if request[1] == 0x03:
+            data = self.device_registers[start:start + 2 * request[5]]
+            return bytearray([0x01, 0x03, len(data)]) + data
+        error = self.write_errors.pop(0) if self.write_errors else None
+        if error is not None:
+            raise error
+        if request[1] == 0x06:
+            data = request[4:6]
+        else:
+            data = request[7:7 + request[6]]
+        end = start + len(data)
+        self.device_registers[start:end] = bytes(
+            (new & ~mask) | (old & mask)
+            for new, old, mask in zip(
+                data, self.device_registers[start:end], HYSEN_2PFC_REGISTER_READ_ONLY[start:end]))
+        return bytearray(request if request[1] == 0x06 else request[0:6])
+
+    def writes(self):
+        return [request.hex(" ") for request in self.sent if request[1] != 0x03]
@@ -0,0 +1,119 @@
+"""
+The rewound CBC contexts against a fresh CBC context per packet, for every
+AES backend that is installed
+"""
+
+import random
+
+import pytest
+
+import broadlink_crypto
+from broadlink_crypto import BROADLINK_AES_BLOCK, broadlink_cipher
+
+KEY = bytes([0x09, 0x76, 0x28, 0x34, 0x3f, 0xe9, 0x9e, 0x23,
+             0x76, 0x5c, 0x15, 0x13, 0xac, 0xcf, 0x8b, 0x02])
+IV = bytes([0x56, 0x2e, 0x17, 0x99, 0x6d, 0x09, 0x3d, 0x28,
+            0xdd, 0xb3, 0xba, 0x69, 0x5a, 0x2e, 0x6f, 0x58])
+
+
+def _cryptography():
+    ciphers = pytest.importorskip("cryptography.hazmat.primitives.ciphers")
+    backends = pytest.importorskip("cryptography.hazmat.backends")
+    return {
+        "Cipher": ciphers.Cipher,
+        "algorithms": ciphers.algorithms,
+        "modes": ciphers.modes,
+        "default_backend": backends.default_backend,
+    }
+
+
+def _pycryptodome():
+    return {"AES": pytest.importorskip("Crypto.Cipher.AES")}
+
+
+def _pyaes():
+    return {"pyaes": pytest.importorskip("pyaes")}
+
+
+BACKENDS = {
+    "cryptography": _cryptography,
+    "pycryptodome": _pycryptodome,
+    "pyaes": _pyaes,
+}
+
+
+# Point broadlink_crypto at one backend whatever the import order picked
+@pytest.fixture(params=list(BACKENDS))
+def backend(request, monkeypatch):
+    for name, value in BACKENDS[request.param]().items():
+        monkeypatch.setattr(broadlink_crypto, name, value, raising=False)
+    monkeypatch.setattr(broadlink_crypto, "BROADLINK_AES_BACKEND", request.param)
+    return request.param
+
+
+def fresh_encrypt(payload):
+    encrypt, _decrypt = broadlink_crypto._cbc_contexts(KEY, IV)
+    return encrypt(bytes(payload))
+
+
+def fresh_decrypt(payload):
+    _encrypt, decrypt = broadlink_crypto._cbc_contexts(KEY, IV)
+    return decrypt(bytes(payload))
+
+
+def payloads():
+    rng = random.Random(0xbeaf)
+    for blocks in [1, 2, 1, 3, 5, 1, 1, 4, 2]:
+        yield bytes(rng.randrange(256) for _ in range(blocks * BROADLINK_AES_BLOCK))
+
+
+def test_encrypt_matches_fresh_context(backend):
+    cipher = broadlink_cipher(KEY, IV)
+    for payload in payloads():
+        assert cipher.encrypt(payload) == fresh_encrypt(payload)
+
+
+def test_decrypt_matches_fresh_context(backend):
+    cipher = broadlink_cipher(KEY, IV)
+    for payload in payloads():
+        assert cipher.decrypt(payload) == fresh_decrypt(payload)
+
+
+def test_interleaved_round_trip(backend):
+    cipher = broadlink_cipher(KEY, IV)
+    for payload in payloads():
+        encrypted = cipher.encrypt(payload)
+        assert encrypted == fresh_encrypt(payload)
+        assert cipher.decrypt(encrypted) == payload
+
+
+def test_memoryview_input(backend):
+    cipher = broadlink_cipher(KEY, IV)
+    packet = bytes(0x38) + fresh_encrypt(bytes(range(32)))
+    assert cipher.decrypt(memoryview(packet)[0x38:]) == bytes(range(32))
+    assert cipher.decrypt(memoryview(packet)[0x38:]) == bytes(range(32))
+
+
+def test_backends_agree():
+    results = set()
+    for name, imports in BACKENDS.items():
+        try:
+            modules = imports()
+        except pytest.skip.Exception:
+            continue
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            for attr, value in modules.items():
+                monkeypatch.setattr(broadlink_crypto, attr, value, raising=False)
+            monkeypatch.setattr(broadlink_crypto, "BROADLINK_AES_BACKEND", name)
+            cipher = broadlink_cipher(KEY, IV)
+            results.add(b"".join(cipher.encrypt(payload) for payload in payloads()))
+    assert len(results) <= 1
+
+
+def test_rejects_unaligned_payload():
+    cipher = broadlink_cipher(KEY, IV)
+    assert cipher.encrypt(b"") == b""
+    with pytest.raises(ValueError):
+        cipher.encrypt(bytes(15))
+    with pytest.raises(ValueError):
+        cipher.decrypt(bytes(17))
@@ -0,0 +1,126 @@
+"""
+Discovery over the loopback interface against broadlink_responder stand-ins
+"""
+
+import asyncio
+
+from hysen2pfc.broadlink_discovery import broadlink_discover, broadlink_responder
+from hysen2pfc.hysen2pfc_device import HYSEN_2PFC_DEV_TYPE, Hysen2PipeFanCoilDevice
+
+LOCALHOST = "127.0.0.1"
+HYSEN_MAC = bytes([0x34, 0xea, 0x34, 0x8a, 0x2b, 0x1c])
+OTHER_MAC = bytes([0x34, 0xea, 0x34, 0x11, 0x22, 0x33])
+# a Broadlink RM mini 3, answers the same hello
+OTHER_DEV_TYPE = 0x27c2
+TIMEOUT = 0.2
+
+
+class segment(asyncio.DatagramProtocol):
+    """Every responder of the segment answers each hello, after delay seconds."""
+
+    def __init__(self, responders, delay=0):
+        self.responders = responders
+        self.delay = delay
+
+    def connection_made(self, transport):
+        for responder in self.responders:
+            responder.connection_made(transport)
+
+    def datagram_received(self, data, addr):
+        loop = asyncio.get_running_loop()
+        for responder in self.responders:
+            loop.call_later(self.delay, responder.datagram_received, data, addr)
+
+
+async def discover_on(responders, delay=0, **kwargs):
+    loop = asyncio.get_running_loop()
+    transport, _protocol = await loop.create_datagram_endpoint(
+        lambda: segment(responders, delay), local_addr=(LOCALHOST, 0))
+    try:
+        return await broadlink_discover(
+            local_ip_address=LOCALHOST,
+            discover_ip_address=LOCALHOST,
+            discover_port=transport.get_extra_info("sockname")[1],
+            **kwargs)
+    finally:
+        transport.close()
+
+
+def test_reply_decoded():
+    async def run():
+        devices = await discover_on(
+            [broadlink_responder(HYSEN_MAC, HYSEN_2PFC_DEV_TYPE, "Reception")],
+            timeout=TIMEOUT)
+        assert len(devices) == 1
+        assert devices[0].host[0] == LOCALHOST
+        assert devices[0].mac == HYSEN_MAC
+        assert devices[0].devtype == HYSEN_2PFC_DEV_TYPE
+        assert devices[0].name == "Reception"
+    asyncio.run(run())
+
+
+def test_device_type_filter():
+    async def run():
+        responders = [
+            broadlink_responder(HYSEN_MAC, HYSEN_2PFC_DEV_TYPE),
+            broadlink_responder(OTHER_MAC, OTHER_DEV_TYPE),
+        ]
+        devices = await discover_on(responders, timeout=TIMEOUT)
+        assert sorted(device.devtype for device in devices) == \
+            sorted([HYSEN_2PFC_DEV_TYPE, OTHER_DEV_TYPE])
+        devices = await discover_on(
+            responders, timeout=TIMEOUT, devtypes=(HYSEN_2PFC_DEV_TYPE,))
+        assert [device.mac for device in devices] == [HYSEN_MAC]
+    asyncio.run(run())
+
+
+def test_hysen_discovery_keeps_hysen_devices():
+    async def run():
+        loop = asyncio.get_running_loop()
+        transport, _protocol = await loop.create_datagram_endpoint(
+            lambda: segment([
+                broadlink_responder(OTHER_MAC, OTHER_DEV_TYPE),
+                broadlink_responder(HYSEN_MAC, HYSEN_2PFC_DEV_TYPE),
+            ]),
+            local_addr=(LOCALHOST, 0))
+        try:
+            devices = await Hysen2PipeFanCoilDevice.async_discover(
+                TIMEOUT,
+                local_ip_address=LOCALHOST,
+                discover_ip_address=LOCALHOST,
+                discover_port=transport.get_extra_info("sockname")[1])
+        finally:
+            transport.close()
+        assert [device.mac for device in devices] == [HYSEN_MAC]
+    asyncio.run(run())
+
+
+def test_duplicate_replies_deduplicated():
+    async def run():
+        responder = broadlink_responder(HYSEN_MAC, HYSEN_2PFC_DEV_TYPE)
+        devices = await discover_on(
+            [responder, responder, broadlink_responder(OTHER_MAC, HYSEN_2PFC_DEV_TYPE)],
+            timeout=TIMEOUT)
+        assert sorted(device.mac for device in devices) == sorted([HYSEN_MAC, OTHER_MAC])
+    asyncio.run(run())
+
+
+def test_nothing_answers_within_timeout():
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        assert await discover_on([], timeout=TIMEOUT) == []
+        assert TIMEOUT <= loop.time() - start < TIMEOUT + 1
+    asyncio.run(run())
+
+
+def test_late_reply_ignored():
+    async def run():
+        devices = await discover_on(
+            [broadlink_responder(HYSEN_MAC, HYSEN_2PFC_DEV_TYPE)],
+            delay=2 * TIMEOUT,
+            timeout=TIMEOUT)
+        assert devices == []
+        # the reply arrives after the endpoint was closed
+        await asyncio.sleep(2 * TIMEOUT)
+    asyncio.run(run())
@@ -0,0 +1,120 @@
+"""
+Packets from the header template against the original per-byte builder
+"""
+
+import pytest
+
+from broadlink_frame import (
+    BROADLINK_HEADER_LEN,
+    broadlink_checksum,
+    broadlink_frame,
+    broadlink_pad,
+    broadlink_reply_count,
+)
+
+MAC = bytes([0x34, 0xea, 0x34, 0x8a, 0x2b, 0x1c])
+ID = bytes([0x01, 0x00, 0x00, 0x00])
+
+
+# stands in for AES, the framing does not look at the ciphertext
+def fake_encrypt(payload):
+    return bytes((b * 7 + 3) & 0xff for b in payload)
+
+
+# broadlink_device._build_packet before the template rewrite
+def reference_packet(mac, id, command, count, payload, encrypt):
+    packet = bytearray(0x38)
+    packet[0x00] = 0x5a
+    packet[0x01] = 0xa5
+    packet[0x02] = 0xaa
+    packet[0x03] = 0x55
+    packet[0x04] = 0x5a
+    packet[0x05] = 0xa5
+    packet[0x06] = 0xaa
+    packet[0x07] = 0x55
+    packet[0x24] = 0x2a
+    packet[0x25] = 0x27
+    packet[0x26] = command
+    packet[0x28] = count & 0xff
+    packet[0x29] = count >> 8
+    packet[0x2a] = mac[0]
+    packet[0x2b] = mac[1]
+    packet[0x2c] = mac[2]
+    packet[0x2d] = mac[3]
+    packet[0x2e] = mac[4]
+    packet[0x2f] = mac[5]
+    packet[0x30] = id[0]
+    packet[0x31] = id[1]
+    packet[0x32] = id[2]
+    packet[0x33] = id[3]
+
+    if payload:
+        numpad = (len(payload) // 16 + 1) * 16
+        payload = payload.ljust(numpad, b"\x00")
+
+    checksum = 0xbeaf
+    for i in range(len(payload)):
+        checksum += payload[i]
+        checksum = checksum & 0xffff
+
+    payload = encrypt(payload)
+
+    packet[0x34] = checksum & 0xff
+    packet[0x35] = checksum >> 8
+
+    for i in range(len(payload)):
+        packet.append(payload[i])
+
+    checksum = 0xbeaf
+    for i in range(len(packet)):
+        checksum += packet[i]
+        checksum = checksum & 0xffff
+    packet[0x20] = checksum & 0xff
+    packet[0x21] = checksum >> 8
+    return packet
+
+
+def template_packet(frame, command, count, payload, encrypt):
+    payload = broadlink_pad(payload)
+    return frame.build(command, count, broadlink_checksum(payload), encrypt(payload))
+
+
+PAYLOADS = [
+    b"",
+    bytes([0x08, 0x00, 0x01, 0x03, 0x00, 0x00, 0x00, 0x10, 0xc5, 0xc6]),
+    bytes(range(16)),
+    bytes([0xff] * 47),
+    bytes(0x50),
+]
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+@pytest.mark.parametrize("command", [0x65, 0x6a])
+@pytest.mark.parametrize("count", [0x0000, 0x0001, 0x00ff, 0x1234, 0xffff])
+def test_frame_matches_reference(payload, command, count):
+    frame = broadlink_frame(MAC)
+    frame.set_id(ID)
+    assert template_packet(frame, command, count, payload, fake_encrypt) == \
+        reference_packet(MAC, ID, command, count, payload, fake_encrypt)
+
+
+def test_frame_follows_id_change():
+    frame = broadlink_frame(MAC)
+    payload = bytes(range(10))
+    assert template_packet(frame, 0x65, 7, payload, fake_encrypt) == \
+        reference_packet(MAC, bytes(4), 0x65, 7, payload, fake_encrypt)
+    frame.set_id(ID)
+    assert template_packet(frame, 0x6a, 8, payload, fake_encrypt) == \
+        reference_packet(MAC, ID, 0x6a, 8, payload, fake_encrypt)
+
+
+def test_pad_adds_a_block_when_aligned():
+    assert broadlink_pad(b"") == b""
+    assert len(broadlink_pad(bytes(1))) == 16
+    assert len(broadlink_pad(bytes(16))) == 32
+
+
+def test_reply_count():
+    packet = template_packet(broadlink_frame(MAC), 0x6a, 0xbeef, bytes(4), fake_encrypt)
+    assert len(packet) == BROADLINK_HEADER_LEN + 16
+    assert broadlink_reply_count(packet) == 0xbeef
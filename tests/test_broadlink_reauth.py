@@ -0,0 +1,104 @@
+"""
+Re-authentication of rejected requests, against a device stand-in that
+accepts one session at a time
+"""
+
+import asyncio
+
+from hysen2pfc.hysen2pfc_device import broadlink_device
+
+READ = bytearray([0x01, 0x03, 0x00, 0x00, 0x00, 0x10])
+
+
+class session_device(broadlink_device):
+    """Replies are the session generation of the request, checked against the
+    one session the device currently accepts."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 80), bytes(6), 0x4F5B)
+        self.accepted_generation = None
+        self.handshake_ok = True
+
+    async def _async_exchange(self, command, payload, hedge=False):
+        if self.auth_task is not None and asyncio.current_task() is not self.auth_task:
+            await asyncio.shield(self.auth_task)
+        generation = self.session_generation
+        await asyncio.sleep(0)
+        return generation, generation
+
+    def _session_response(self, input_payload, response):
+        return b"ok" if response == self.accepted_generation else None
+
+    async def async_auth(self):
+        await asyncio.sleep(0.01)
+        if not self.handshake_ok:
+            return False
+        self.session_generation += 1
+        self.accepted_generation = self.session_generation
+        return True
+
+    # the device dropped the session, e.g. after a power cycle
+    def forget_session(self):
+        self.accepted_generation = None
+
+
+async def _reads(device, number):
+    return await asyncio.gather(
+        *[device.async_send_request(READ) for _ in range(number)],
+        return_exceptions=True)
+
+
+def test_concurrent_rejections_share_one_handshake():
+    async def run():
+        device = session_device()
+        results = await _reads(device, 10)
+        assert results == [b"ok"] * 10
+        assert device.auths_sent == 1
+        assert device.auths_avoided == 9
+    asyncio.run(run())
+
+
+def test_session_rejected_right_after_handshake_is_renegotiated():
+    async def run():
+        device = session_device()
+        assert await device.async_send_request(READ) == b"ok"
+        assert device.auths_sent == 1
+        # rejected moments after a successful handshake
+        device.forget_session()
+        results = await _reads(device, 10)
+        assert results == [b"ok"] * 10
+        assert device.auths_sent == 2
+        assert device.auths_avoided == 9
+    asyncio.run(run())
+
+
+def test_rejection_of_a_replaced_session_skips_the_handshake():
+    async def run():
+        device = session_device()
+        assert await device.async_reauth()
+        stale = device.session_generation - 1
+        assert await device.async_reauth(stale)
+        assert device.auths_sent == 1
+        assert device.auths_avoided == 1
+        # the current session itself was rejected
+        assert await device.async_reauth(device.session_generation)
+        assert device.auths_sent == 2
+        assert device.auths_avoided == 1
+    asyncio.run(run())
+
+
+def test_failed_handshake_backs_off():
+    async def run():
+        device = session_device()
+        device.handshake_ok = False
+        results = await _reads(device, 3)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert device.auths_sent == 1
+        # within the backoff no handshake is sent
+        assert not await device.async_reauth(device.session_generation)
+        assert device.auths_sent == 1
+        device.auth_retry_time = 0
+        device.handshake_ok = True
+        assert await device.async_reauth(device.session_generation)
+        assert device.auths_sent == 2
+    asyncio.run(run())
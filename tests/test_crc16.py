@@ -0,0 +1,89 @@
+"""
+CRC16/Modbus against the catalogue check value, the frames of the protocol
+notes in hysen2pfc_device.py and a bitwise reference implementation
+"""
+
+import random
+
+import pytest
+
+from crc16 import CRC16_MODBUS_TABLE, crc16_modbus
+
+
+# one bit at a time, the textbook definition of CRC16/Modbus
+def reference_crc16_modbus(data):
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc
+
+
+# Frames from the send_request notes, CRCs as computed by PyCRC
+# (CRC16(modbus_flag=True)) that the integration used before
+PROTOCOL_FRAMES = [
+    # write a word, request and its echo
+    ("01 06 00 04 28 0a", 0x0c56),
+    # write several words
+    ("01 10 00 07 00 02 04 08 14 10 02", 0x2c7c),
+    ("01 10 00 08 00 02", 0x0ac0),
+    # read several words
+    ("01 03 00 07 00 02", 0xca75),
+    ("01 03 04 08 14 10 02", 0x5634),
+    # error response
+    ("01 90 01", 0xc08d),
+    # read of 10 holding registers, the usual Modbus specification example
+    ("01 03 00 00 00 0a", 0xcdc5),
+]
+
+
+def test_check_value():
+    assert crc16_modbus(b"123456789") == 0x4B37
+
+
+def test_empty():
+    assert crc16_modbus(b"") == 0xFFFF
+
+
+@pytest.mark.parametrize("frame,crc", PROTOCOL_FRAMES)
+def test_protocol_frames(frame, crc):
+    assert crc16_modbus(bytes.fromhex(frame)) == crc
+
+
+# CRC appended low byte first, as on the wire, leaves a zero remainder
+@pytest.mark.parametrize("frame,crc", PROTOCOL_FRAMES)
+def test_frame_with_crc_has_zero_remainder(frame, crc):
+    assert crc16_modbus(bytes.fromhex(frame) + bytes([crc & 0xFF, crc >> 8])) == 0
+
+
+def test_table_matches_reference():
+    assert len(CRC16_MODBUS_TABLE) == 256
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        assert CRC16_MODBUS_TABLE[byte] == crc
+
+
+def test_matches_reference():
+    rng = random.Random(0x4B37)
+    for length in list(range(0, 40)) + [255, 1024]:
+        data = bytes(rng.randrange(256) for _ in range(length))
+        assert crc16_modbus(data) == reference_crc16_modbus(data)
+
+
+def test_buffer_types():
+    data = bytes.fromhex("08 00 01 03 00 07 00 02 75 ca")
+    crc = reference_crc16_modbus(data[2:8])
+    assert crc16_modbus(data[2:8]) == crc
+    assert crc16_modbus(bytearray(data[2:8])) == crc
+    assert crc16_modbus(memoryview(data)[2:8]) == crc
+
+
+def test_incremental():
+    data = b"123456789"
+    assert crc16_modbus(data[4:], crc16_modbus(data[:4])) == 0x4B37
@@ -0,0 +1,77 @@
+"""
+Debounced writes of apply_later() and the callers each write answers
+"""
+
+import asyncio
+import logging
+
+from simulated_hysen import simulated_hysen
+
+DEBOUNCE = 0.01
+EXCHANGE = 0.05
+
+
+def polled_device():
+    device = simulated_hysen()
+    device.get_device_status()
+    device.sent = []
+    device.debounce_delay = DEBOUNCE
+    device.delay = EXCHANGE
+    return device
+
+
+def test_values_set_together_written_once():
+    async def run():
+        device = polled_device()
+        first = device.apply_later({'target_temp': 24})
+        second = device.apply_later({'target_temp': 25})
+        await asyncio.wait_for(asyncio.gather(first, second), 1)
+        assert device.writes() == ["01 06 00 02 00 19"]
+        assert device.status.target_temp == 25
+    asyncio.run(run())
+
+
+def test_value_set_during_write_waits_for_its_own():
+    async def run():
+        device = polled_device()
+        first = device.apply_later({'target_temp': 24})
+        # the 24 write is in flight
+        await asyncio.sleep(DEBOUNCE + EXCHANGE / 2)
+        second = device.apply_later({'target_temp': 25})
+        await asyncio.wait_for(first, 1)
+        assert device.writes() == ["01 06 00 02 00 18"]
+        assert not second.done()
+        await asyncio.wait_for(second, 1)
+        assert device.writes() == ["01 06 00 02 00 18", "01 06 00 02 00 19"]
+        assert device.status.target_temp == 25
+    asyncio.run(run())
+
+
+def test_failure_of_the_newer_write_reaches_its_caller():
+    async def run():
+        device = polled_device()
+        device.write_errors = [None, ValueError("no answer")]
+        first = device.apply_later({'target_temp': 24})
+        await asyncio.sleep(DEBOUNCE + EXCHANGE / 2)
+        second = device.apply_later({'target_temp': 25})
+        await asyncio.wait_for(first, 1)
+        try:
+            await asyncio.wait_for(second, 1)
+            assert False, "the 25 write failed"
+        except ValueError:
+            pass
+        assert device.device_registers[5] == 24
+        assert device.pending == {}
+    asyncio.run(run())
+
+
+def test_failure_without_caller_logged(caplog):
+    async def run():
+        device = polled_device()
+        device.write_errors = [ValueError("no answer")]
+        device.apply_later({'target_temp': 24}).cancel()
+        await asyncio.sleep(DEBOUNCE + 2 * EXCHANGE)
+        assert device.pending_waiters == []
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(run())
+    assert "delayed write of target_temp failed: no answer" in caplog.text
@@ -0,0 +1,126 @@
+"""
+Register mirror and the writes planned from it by apply()
+"""
+
+import asyncio
+import time
+
+from simulated_hysen import REGISTERS, simulated_hysen
+
+
+def polled_device():
+    device = simulated_hysen()
+    device.get_device_status()
+    device.sent = []
+    return device
+
+
+def test_read_fills_mirror():
+    device = simulated_hysen()
+    assert device.status.room_temp == 0
+    device.get_device_status()
+    assert bytes(device.registers) == REGISTERS
+    assert None not in device.registers_time
+    assert device.status.room_temp == 23
+    assert device.status.valve_state == 1
+
+
+def test_fresh_mirror_skips_reads():
+    device = polled_device()
+    device.apply({'target_temp': 24})
+    assert [request[1] for request in device.sent] == [0x06]
+
+
+def test_single_word_clears_valve_bit():
+    device = polled_device()
+    assert device.apply({'power_state': 0}) == 1
+    assert device.writes() == ["01 06 00 00 00 00"]
+
+
+def test_single_word_clears_room_temp():
+    device = polled_device()
+    device.apply({'target_temp': 24})
+    assert device.writes() == ["01 06 00 02 00 18"]
+
+
+def test_unchanged_fields_not_written():
+    device = polled_device()
+    assert device.apply({'target_temp': 22, 'power_state': 1}) == 0
+    assert device.writes() == []
+
+
+def test_adjacent_words_merged():
+    device = polled_device()
+    assert device.apply(
+        {'hysteresis': 0, 'calibration': 1.5, 'heating_max_temp': 35, 'heating_min_temp': 15}) == 1
+    assert device.writes() == ["01 10 00 03 00 03 06 00 0f 28 0a 23 0f"]
+
+
+def test_merge_across_room_temp_clears_it():
+    device = polled_device()
+    # words 1 and 3 changed, word 2 is rewritten as it is but for the room temperature
+    assert device.apply({'fan_mode': 2, 'hysteresis': 0}) == 1
+    assert device.writes() == ["01 10 00 01 00 03 06 03 02 00 16 00 00"]
+
+
+def test_far_words_written_apart():
+    device = polled_device()
+    assert device.apply({'power_state': 0, 'frost_protection': 0}) == 2
+    assert device.writes() == ["01 06 00 00 00 00", "01 06 00 06 00 00"]
+
+
+def test_mirror_after_write():
+    device = polled_device()
+    version = device.registers_version
+    device.apply({'power_state': 0, 'target_temp': 24})
+    assert device.writes() == ["01 10 00 00 00 03 06 00 00 03 01 00 18"]
+    # read-only bits keep their mirrored value, the written ones the value sent
+    assert device.registers[0:6] == bytes.fromhex("0010 0301 1718")
+    assert device.registers == device.device_registers
+    assert device.registers_written == {0, 1, 2}
+    assert device.registers_version > version
+    assert (device.status.power_state, device.status.target_temp) == (0, 24)
+    assert device.status.valve_state == 1
+    assert device.status.room_temp == 23
+
+
+def test_read_after_write_confirms_words():
+    device = polled_device()
+    device.apply({'target_temp': 24})
+    device.device_registers[4] = 0x18
+    device.get_device_status()
+    assert device.registers_written == set()
+    assert device.status.room_temp == 24
+
+
+def test_async_apply_updates_mirror():
+    async def run():
+        device = polled_device()
+        assert await device.async_apply({'operation_mode': 2, 'target_temp': 20}) == 1
+        assert device.writes() == ["01 10 00 01 00 02 04 02 01 00 14"]
+        assert device.registers == device.device_registers
+        assert (device.status.operation_mode, device.status.target_temp) == (2, 20)
+    asyncio.run(run())
+
+
+def test_valve_counter_is_no_control_change():
+    device = polled_device()
+    versions = (device.registers_version, device.control_version)
+    device.device_registers[31] += 5
+    device.device_registers[15] += 1
+    device.get_device_status()
+    assert device.registers_version > versions[0]
+    assert device.control_version == versions[1]
+    device.device_registers[5] = 24
+    device.get_device_status()
+    assert device.control_version > versions[1]
+
+
+def test_stale_words_read_before_write():
+    device = polled_device()
+    # changed on the panel since the mirror was confirmed
+    device.device_registers[9] = 0x0c
+    device.registers_time[3:7] = [time.monotonic() - 2 * device.register_max_age] * 4
+    device.apply({'calibration': 1.5})
+    assert [request[1] for request in device.sent] == [0x03, 0x06]
+    assert device.device_registers[6:10] == bytes.fromhex("010f 280c")
@@ -0,0 +1,91 @@
+"""
+Programmed switches predicted from the decoded status and the device clock
+"""
+
+import time
+
+from hysen2pfc.hysen2pfc_device import (
+    HYSEN_2PFC_DEFAULT_STATUS,
+    HYSEN_2PFC_DEV_TYPE,
+    HYSEN_2PFC_PERIOD_ENABLED,
+    HYSEN_2PFC_SCHEDULE_12345_67,
+    HYSEN_2PFC_SCHEDULE_123456_7,
+    HYSEN_2PFC_SCHEDULE_1234567,
+    HYSEN_2PFC_SCHEDULE_TODAY,
+    Hysen2PipeFanCoilDevice,
+)
+
+
+# Device whose whole register file was read just now, the clock at weekday hour:min
+def device_at(weekday, hour, minute, schedule, **periods):
+    device = Hysen2PipeFanCoilDevice(("127.0.0.1", 80), bytes(6), HYSEN_2PFC_DEV_TYPE, 10)
+    device.status = HYSEN_2PFC_DEFAULT_STATUS._replace(
+        clock_weekday=weekday, clock_hour=hour, clock_min=minute, clock_sec=0,
+        schedule=schedule, **periods)
+    now = time.monotonic()
+    device.registers_time = [now] * len(device.registers_time)
+    device.clock_read_time = now
+    return device
+
+
+def period1(on_hour, off_hour):
+    return dict(
+        period1_on_enabled=HYSEN_2PFC_PERIOD_ENABLED,
+        period1_on_hour=on_hour,
+        period1_on_min=0,
+        period1_off_enabled=HYSEN_2PFC_PERIOD_ENABLED,
+        period1_off_hour=off_hour,
+        period1_off_min=0)
+
+
+def hours(seconds):
+    return round(seconds / 3600, 2)
+
+
+def test_no_period_enabled():
+    assert device_at(1, 7, 0, HYSEN_2PFC_SCHEDULE_1234567).next_transition() is None
+
+
+def test_status_unknown():
+    device = device_at(1, 7, 0, HYSEN_2PFC_SCHEDULE_1234567, **period1(8, 18))
+    device.clock_read_time = None
+    assert device.next_transition() is None
+
+
+def test_next_switch_today():
+    device = device_at(1, 7, 0, HYSEN_2PFC_SCHEDULE_1234567, **period1(8, 18))
+    assert hours(device.next_transition()) == 1
+    device = device_at(1, 12, 0, HYSEN_2PFC_SCHEDULE_1234567, **period1(8, 18))
+    assert hours(device.next_transition()) == 6
+
+
+def test_next_switch_tomorrow():
+    for schedule in (HYSEN_2PFC_SCHEDULE_TODAY, HYSEN_2PFC_SCHEDULE_1234567):
+        device = device_at(7, 20, 0, schedule, **period1(8, 18))
+        assert hours(device.next_transition()) == 12
+
+
+def test_working_days_of_12345_67():
+    # Thursday evening, Friday's switch on is known
+    device = device_at(4, 20, 0, HYSEN_2PFC_SCHEDULE_12345_67, **period1(8, 18))
+    assert hours(device.next_transition()) == 12
+    # Friday afternoon, the switch off is still ahead
+    device = device_at(5, 12, 0, HYSEN_2PFC_SCHEDULE_12345_67, **period1(8, 18))
+    assert hours(device.next_transition()) == 6
+
+
+def test_weekend_programme_is_not_predicted():
+    # Friday evening, the weekend programme is not decoded
+    device = device_at(5, 20, 0, HYSEN_2PFC_SCHEDULE_12345_67, **period1(8, 18))
+    assert device.next_transition() is None
+    device = device_at(6, 7, 0, HYSEN_2PFC_SCHEDULE_12345_67, **period1(8, 18))
+    assert device.next_transition() is None
+    device = device_at(7, 7, 0, HYSEN_2PFC_SCHEDULE_123456_7, **period1(8, 18))
+    assert device.next_transition() is None
+
+
+def test_saturday_of_123456_7():
+    device = device_at(6, 7, 0, HYSEN_2PFC_SCHEDULE_123456_7, **period1(8, 18))
+    assert hours(device.next_transition()) == 1
+    device = device_at(6, 20, 0, HYSEN_2PFC_SCHEDULE_123456_7, **period1(8, 18))
+    assert device.next_transition() is None
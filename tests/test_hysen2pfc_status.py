@@ -0,0 +1,55 @@
+"""
+Status decoding against the register map
+"""
+
+import random
+
+from hysen2pfc.hysen2pfc_device import (
+    HYSEN_2PFC_STATUS_MAP,
+    HYSEN_2PFC_STATUS_SCALE,
+    HYSEN_2PFC_STATUS_STRUCT,
+    Hysen2PipeFanCoilStatus,
+)
+
+
+# one field at a time from HYSEN_2PFC_STATUS_MAP
+def reference_status(data):
+    raw = HYSEN_2PFC_STATUS_STRUCT.unpack_from(data)
+    values = {}
+    for name, index, shift, mask in HYSEN_2PFC_STATUS_MAP:
+        value = raw[index] >> shift
+        if mask is not None:
+            value &= mask
+        if name in HYSEN_2PFC_STATUS_SCALE:
+            value /= HYSEN_2PFC_STATUS_SCALE[name]
+        values[name] = value
+    return values
+
+
+def test_decoder_follows_register_map():
+    rng = random.Random(0x4F5B)
+    for _ in range(200):
+        data = bytes(rng.randrange(256) for _ in range(HYSEN_2PFC_STATUS_STRUCT.size))
+        assert Hysen2PipeFanCoilStatus.from_registers(data)._asdict() == reference_status(data)
+
+
+def test_known_status():
+    data = bytes.fromhex(
+        "0311 0301 1716 02fb 2810 2808 0001 0e1e 0503 0002 8800 1200 0000 0000 0001 e240")
+    status = Hysen2PipeFanCoilStatus.from_registers(data)
+    assert (status.remote_lock, status.key_lock) == (0, 3)
+    assert (status.valve_state, status.power_state) == (1, 1)
+    assert (status.room_temp, status.target_temp) == (23, 22)
+    assert status.calibration == -0.5
+    assert (status.clock_hour, status.clock_min, status.clock_sec, status.clock_weekday) == \
+        (14, 30, 5, 3)
+    assert status.schedule == 2
+    assert (status.period1_on_enabled, status.period1_on_hour, status.period1_on_min) == (1, 8, 0)
+    assert (status.period1_off_enabled, status.period1_off_hour) == (0, 18)
+    assert status.time_valve_on == 123456
+
+
+def test_offset():
+    data = bytes(range(32))
+    assert Hysen2PipeFanCoilStatus.from_registers(bytes(3) + data, 3) == \
+        Hysen2PipeFanCoilStatus.from_registers(data)